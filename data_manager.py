@@ -5,11 +5,17 @@ Fetches match data from API-Football with intelligent caching to save API/credit
 """
 
 import os
-import json
 import time
+import random
+import functools
+import threading
+import msgpack
+import orjson
 import requests
-from datetime import datetime, timedelta
-from typing import List, Dict, Any, Optional
+from requests.adapters import HTTPAdapter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timedelta
+from typing import List, Dict, Any, Optional, Tuple
 import logging
 
 # Configure logging
@@ -21,18 +27,46 @@ API_FOOTBALL_BASE = f"https://{API_FOOTBALL_HOST}/v3"
 EPL_LEAGUE_ID = 39  # English Premier League
 CURRENT_SEASON = 2025 # Default if auto-detect fails
 
-CACHE_FILE = 'fixtures_cache.json'
+# Shared HTTP session: keeps TCP/TLS connections to the API alive between calls
+_SESSION = requests.Session()
+_SESSION.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=16))
+
+CACHE_DIR = 'cache'  # One msgpack file per cache key, e.g. cache/fixtures_39.msgpack
 CACHE_DURATION = 3600  # 1 hour in seconds
+CACHE_JITTER = 300  # +/- seconds added per entry so leagues don't all expire together
+STALE_GRACE = 6 * 3600  # Expired entries younger than this are served while refreshing
+MIN_REFRESH_INTERVAL = 60  # Entries younger than this are never rewritten
+
+# In-memory copy of each cache entry, reloaded only when its file's mtime changes
+_CACHE_MEM: Dict[str, Any] = {}
+_CACHE_MTIME: Dict[str, float] = {}
+
+# Leagues with a background refresh in flight
+_refreshing: set = set()
+_refreshing_lock = threading.Lock()
+
+# Per-league locks so concurrent cache misses make a single API call
+_league_locks: Dict[int, threading.Lock] = {}
 
 
 def get_headers() -> Dict[str, str]:
     """Get API headers with RapidAPI key."""
-    api_key = os.getenv("RAPIDAPI_KEY", "")
+    return _build_headers(os.getenv("RAPIDAPI_KEY", ""))
+
+
+@functools.lru_cache(maxsize=1)
+def _build_headers(api_key: str) -> Dict[str, str]:
+    """
+    Build the headers dict once per API key.
+    Keyed on the key itself, so a key loaded after import (load_dotenv) is picked up.
+    """
     if not api_key:
         logger.warning("RAPIDAPI_KEY not set in environment!")
     return {
         "X-RapidAPI-Key": api_key,
-        "X-RapidAPI-Host": API_FOOTBALL_HOST
+        "X-RapidAPI-Host": API_FOOTBALL_HOST,
+        "Accept-Encoding": "gzip, deflate",
+        "Connection": "keep-alive"
     }
 
 
@@ -43,70 +77,141 @@ def is_mock_mode() -> bool:
 
 def get_current_season() -> int:
     """Auto-detect current football season."""
-    now = datetime.now()
-    if now.month >= 8:  # August onwards
-        return now.year
+    return _season_for_day(datetime.now().toordinal())
+
+
+@functools.lru_cache(maxsize=1)
+def _season_for_day(day: int) -> int:
+    """Season for a given day (date ordinal), cached until the day changes."""
+    today = date.fromordinal(day)
+    if today.month >= 8:  # August onwards
+        return today.year
     else:  # Jan-July
-        return now.year - 1
+        return today.year - 1
 
 
 # =============================================================================
 # CACHING SYSTEM
 # =============================================================================
 
-def load_cache() -> Dict[str, Any]:
-    """Load cached data from file."""
-    if not os.path.exists(CACHE_FILE):
-        return {}
+def _cache_path(key: str) -> str:
+    """Get the file path of a single cache entry."""
+    return os.path.join(CACHE_DIR, f"{key}.msgpack")
+
+
+def load_cache_entry(key: str) -> Optional[Dict[str, Any]]:
+    """
+    Load one cached entry from its own file.
+    The file is only re-read when its mtime changes; otherwise the
+    in-memory copy is returned.
+    """
+    path = _cache_path(key)
+    try:
+        mtime = os.stat(path).st_mtime
+    except FileNotFoundError:
+        _CACHE_MEM.pop(key, None)
+        _CACHE_MTIME.pop(key, None)
+        return None
+    
+    if _CACHE_MTIME.get(key) == mtime:
+        return _CACHE_MEM[key]
     
     try:
-        with open(CACHE_FILE, 'r') as f:
-            return json.load(f)
+        with open(path, 'rb') as f:
+            entry = msgpack.unpackb(f.read(), raw=False)
     except Exception as e:
-        logger.error(f"Failed to load cache: {e}")
-        return {}
+        logger.error(f"Failed to load cache entry {key}: {e}")
+        return None
+    
+    _CACHE_MEM[key] = entry
+    _CACHE_MTIME[key] = mtime
+    return entry
 
 
-def save_cache(data: Dict[str, Any]) -> None:
-    """Save data to cache file."""
+def save_cache_entry(key: str, entry: Dict[str, Any]) -> None:
+    """Save one entry to its own cache file (only that file is rewritten)."""
+    path = _cache_path(key)
     try:
-        current_cache = load_cache()
-        current_cache.update(data)
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        
+        # Write to a temp file and swap it in, so a crash mid-write
+        # can't leave a truncated cache behind. The temp name is per
+        # thread so concurrent writers never share one.
+        tmp_file = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_file, 'wb') as f:
+            f.write(msgpack.packb(entry, use_bin_type=True))
+        os.replace(tmp_file, path)
         
-        with open(CACHE_FILE, 'w') as f:
-            json.dump(current_cache, f, indent=2)
+        _CACHE_MEM[key] = entry
+        _CACHE_MTIME[key] = os.stat(path).st_mtime
     except Exception as e:
-        logger.error(f"Failed to save cache: {e}")
+        logger.error(f"Failed to save cache entry {key}: {e}")
 
 
-def get_cached_fixtures(league_id: int) -> Optional[List[Dict]]:
-    """Get fixtures from cache if they are fresh."""
-    cache = load_cache()
-    key = f"fixtures_{league_id}"
+def get_cached_fixtures(league_id: int, count: int = 10) -> Optional[List[Dict]]:
+    """
+    Get fixtures from cache.
+    Fresh entries are returned as-is. Recently expired entries are still
+    returned (stale-while-revalidate) while a background thread refreshes
+    them, so only a cold or very old cache makes the caller wait on the API.
+    """
+    entry = load_cache_entry(f"fixtures_{league_id}")
     
-    if key in cache:
-        entry = cache[key]
-        timestamp = entry.get('timestamp', 0)
+    if entry is not None:
+        age = time.time() - entry.get('timestamp', 0)
+        ttl = entry.get('ttl', CACHE_DURATION)
         
-        # Check if cache is still valid (less than 60 mins old)
-        if time.time() - timestamp < CACHE_DURATION:
+        # Check if cache is still valid (~60 mins old, jittered per entry)
+        if age < ttl:
             logger.info(f"✅ Using CACHED fixtures for League {league_id}")
             return entry.get('data', [])
+        elif age < ttl + STALE_GRACE:
+            logger.info(f"♻️ Using STALE fixtures for League {league_id}, refreshing in background")
+            _start_background_refresh(league_id, count)
+            return entry.get('data', [])
         else:
             logger.info(f"⚠️ Cache expired for League {league_id}")
     
     return None
 
 
+def _start_background_refresh(league_id: int, count: int) -> None:
+    """Refresh a league's cache in a daemon thread (one refresh per league at a time)."""
+    with _refreshing_lock:
+        if league_id in _refreshing:
+            return
+        _refreshing.add(league_id)
+    
+    threading.Thread(target=_refresh_async, args=(league_id, count), daemon=True).start()
+
+
+def _league_lock(league_id: int) -> threading.Lock:
+    """Get the fetch lock for a league."""
+    return _league_locks.setdefault(league_id, threading.Lock())
+
+
+def _refresh_async(league_id: int, count: int) -> None:
+    """Background worker for stale-while-revalidate."""
+    try:
+        with _league_lock(league_id):
+            _fetch_fixtures_from_api(league_id, count)
+    finally:
+        with _refreshing_lock:
+            _refreshing.discard(league_id)
+
+
 def update_fixture_cache(league_id: int, fixtures: List[Dict]) -> None:
-    """Update cache with new fixtures."""
-    cache_entry = {
-        f"fixtures_{league_id}": {
-            'timestamp': time.time(),
-            'data': fixtures
-        }
-    }
-    save_cache(cache_entry)
+    """Update cache with new fixtures (skipped if the entry was just written)."""
+    existing = load_cache_entry(f"fixtures_{league_id}")
+    if existing and time.time() - existing.get('timestamp', 0) < MIN_REFRESH_INTERVAL:
+        logger.info(f"⏳ Cache for League {league_id} refreshed recently, skipping write")
+        return
+    
+    save_cache_entry(f"fixtures_{league_id}", {
+        'timestamp': time.time(),
+        'ttl': CACHE_DURATION + random.uniform(-CACHE_JITTER, CACHE_JITTER),
+        'data': fixtures
+    })
 
 
 # =============================================================================
@@ -121,15 +226,15 @@ def get_mock_fixtures(league_id: int):
     # EPL Mock
     if league_id == 39:
         return [
-            {'fixture_id': 101, 'date': today, 'time': '12:30', 'home_team': 'Arsenal', 'away_team': 'Man Utd'},
-            {'fixture_id': 102, 'date': today, 'time': '15:00', 'home_team': 'Liverpool', 'away_team': 'Chelsea'},
-            {'fixture_id': 103, 'date': tomorrow, 'time': '16:30', 'home_team': 'Man City', 'away_team': 'Spurs'},
+            {'fixture_id': 101, 'datetime': f'{today}T12:30:00+00:00', 'home_team': 'Arsenal', 'away_team': 'Man Utd'},
+            {'fixture_id': 102, 'datetime': f'{today}T15:00:00+00:00', 'home_team': 'Liverpool', 'away_team': 'Chelsea'},
+            {'fixture_id': 103, 'datetime': f'{tomorrow}T16:30:00+00:00', 'home_team': 'Man City', 'away_team': 'Spurs'},
         ]
     # La Liga Mock
     elif league_id == 140:
         return [
-            {'fixture_id': 201, 'date': today, 'time': '20:00', 'home_team': 'Real Madrid', 'away_team': 'Barcelona'},
-            {'fixture_id': 202, 'date': tomorrow, 'time': '18:30', 'home_team': 'Atletico', 'away_team': 'Sevilla'},
+            {'fixture_id': 201, 'datetime': f'{today}T20:00:00+00:00', 'home_team': 'Real Madrid', 'away_team': 'Barcelona'},
+            {'fixture_id': 202, 'datetime': f'{tomorrow}T18:30:00+00:00', 'home_team': 'Atletico', 'away_team': 'Sevilla'},
         ]
     return []
 
@@ -145,12 +250,39 @@ def fetch_fixtures_with_cache(league_id: int, count: int = 10) -> List[Dict]:
     2. If missing/old -> Call API -> Save Cache
     3. If API fails -> Return Mock Data
     """
+    return fetch_fixtures_with_source(league_id, count)[0]
+
+
+def fetch_fixtures_with_source(league_id: int, count: int = 10) -> Tuple[List[Dict], bool]:
+    """
+    fetch_fixtures_with_cache, plus whether the fixtures are real.
+    Returns (fixtures, is_live); is_live is False for the mock fallback.
+    """
     # 1. Check Cache
-    cached_data = get_cached_fixtures(league_id)
+    cached_data = get_cached_fixtures(league_id, count)
     if cached_data:
-        return cached_data
+        return cached_data, True
+
+    # 2. Call API (one caller per league; the rest wait and reuse its result)
+    with _league_lock(league_id):
+        cached_data = get_cached_fixtures(league_id, count)
+        if cached_data:
+            return cached_data, True
+        
+        fixtures = _fetch_fixtures_from_api(league_id, count)
+    
+    if fixtures:
+        return fixtures, True
+    
+    # 3. Fallback
+    return get_mock_fixtures(league_id), False
+
 
-    # 2. Call API
+def _fetch_fixtures_from_api(league_id: int, count: int) -> Optional[List[Dict]]:
+    """
+    Call the API for upcoming fixtures and save them to cache.
+    Returns None if the API call fails or returns nothing.
+    """
     season = get_current_season()
     url = f"{API_FOOTBALL_BASE}/fixtures"
     params = {
@@ -162,35 +294,28 @@ def fetch_fixtures_with_cache(league_id: int, count: int = 10) -> List[Dict]:
     logger.info(f"🌐 Calling API for League {league_id}...")
     
     try:
-        response = requests.get(url, headers=get_headers(), params=params, timeout=15)
+        response = _SESSION.get(url, headers=get_headers(), params=params, timeout=15)
         
         # Check quotas
         if response.status_code in [429, 403]:
             logger.warning(f"API Quota Exceeded ({response.status_code}). Using Mock Data.")
-            return get_mock_fixtures(league_id)
+            return None
             
         response.raise_for_status()
-        data = response.json()
+        data = orjson.loads(response.content)
         
         if data.get('errors'):
             logger.error(f"API Error: {data['errors']}")
-            return get_mock_fixtures(league_id)
+            return None
 
         fixtures = []
         for fixture in data.get('response', []):
             fixture_data = fixture.get('fixture', {})
             teams = fixture.get('teams', {})
             
-            # Parse datetime
-            fixture_datetime = fixture_data.get('date', '')
-            fixture_date = fixture_datetime[:10] if fixture_datetime else ''
-            fixture_time = fixture_datetime[11:16] if len(fixture_datetime) > 11 else '00:00'
-            
             fixtures.append({
                 'fixture_id': fixture_data.get('id'),
-                'date': fixture_date,
-                'time': fixture_time,
-                'datetime': fixture_datetime,
+                'datetime': fixture_data.get('date', ''),  # ISO 8601, parsed on display
                 'status': fixture_data.get('status', {}).get('short', 'NS'),
                 'home_team': teams.get('home', {}).get('name', 'Unknown'),
                 'away_team': teams.get('away', {}).get('name', 'Unknown'),
@@ -201,7 +326,7 @@ def fetch_fixtures_with_cache(league_id: int, count: int = 10) -> List[Dict]:
         
         if not fixtures:
             # Don't cache empty results, maybe just return mock
-            return get_mock_fixtures(league_id)
+            return None
             
         # Save to Cache
         update_fixture_cache(league_id, fixtures)
@@ -210,7 +335,21 @@ def fetch_fixtures_with_cache(league_id: int, count: int = 10) -> List[Dict]:
     
     except Exception as e:
         logger.error(f"Error fetching fixtures: {e}")
-        return get_mock_fixtures(league_id)
+        return None
+
+
+def fetch_fixtures_batch(league_ids: List[int], count: int = 10) -> Dict[int, List[Dict]]:
+    """
+    Fetch fixtures for several leagues at once.
+    Cache misses hit the API in parallel threads, so total time is the
+    slowest league rather than the sum of all of them.
+    """
+    if not league_ids:
+        return {}
+    
+    with ThreadPoolExecutor(max_workers=len(league_ids)) as pool:
+        results = pool.map(lambda lid: fetch_fixtures_with_cache(lid, count), league_ids)
+        return dict(zip(league_ids, results))
 
 
 # =============================================================================
@@ -237,9 +376,9 @@ def fetch_team_statistics(team_id: int) -> Dict[str, Any]:
     params = {"league": EPL_LEAGUE_ID, "season": CURRENT_SEASON, "team": team_id}
     
     try:
-        response = requests.get(url, headers=get_headers(), params=params, timeout=15)
+        response = _SESSION.get(url, headers=get_headers(), params=params, timeout=15)
         response.raise_for_status()
-        data = response.json().get('response', {})
+        data = orjson.loads(response.content).get('response', {})
         
         if not data: return {}
         
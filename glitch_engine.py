@@ -1,22 +1,45 @@
 """
 The Glitch Engine - ML-Powered Prediction Logic
 ================================================
-Uses trained Random Forest models for multi-market predictions.
+Uses trained gradient-boosted tree models for multi-market predictions.
 """
 
 import os
-import pickle
 import json
+import functools
+import joblib
 import pandas as pd
 import numpy as np
-from typing import Dict, Any, List, Optional
+from typing import Dict, Any, List, Optional, Tuple
 from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    import onnxruntime as ort
+except ImportError:
+    # Optional: without it the sklearn models are used directly
+    ort = None
 
 
 # Global cache for models
 _models_cache = None
 _config_cache = None
 _data_cache = None
+_data_version = None  # (id, file mtime) of _data_cache - keys the team stats memo
+_team_index = None  # (df, home_groups, away_groups) - per-team row slices of df
+
+# Where each model feature comes from: (team side, get_team_stats key)
+# Matches the columns used during training (train_glitch.py)
+_FEATURE_SOURCES = {
+    'HomeTeam_Form': ('home', 'form'),              # Points from last 5 games (max 15)
+    'AwayTeam_Form': ('away', 'form'),              # Points from last 5 games (max 15)
+    'Home_Avg_Goals': ('home', 'avg_goals'),        # Attack strength
+    'Away_Avg_Goals': ('away', 'avg_goals'),        # Attack strength
+    'Home_Avg_Conceded': ('home', 'avg_conceded'),  # Defense weakness
+    'Away_Avg_Conceded': ('away', 'avg_conceded'),  # Defense weakness
+    'Home_BTTS_Rate': ('home', 'btts_rate'),        # % of recent games with BTTS
+    'Away_BTTS_Rate': ('away', 'btts_rate')         # % of recent games with BTTS
+}
 
 
 def load_models():
@@ -35,23 +58,72 @@ def load_models():
         with open(os.path.join(script_dir, 'features.json'), 'r') as f:
             _config_cache = json.load(f)
         
-        _models_cache = {}
-        for name in ['win', 'goals', 'btts']:
-            model_path = os.path.join(script_dir, f"model_{name}.pkl")
-            with open(model_path, 'rb') as f:
-                _models_cache[name] = pickle.load(f)
+        # Load the three models in parallel
+        names = ['win', 'goals', 'btts']
+        with ThreadPoolExecutor(max_workers=len(names)) as pool:
+            loaded = list(pool.map(lambda name: _load_model(script_dir, name), names))
         
+        _check_feature_order(loaded, _config_cache['features'])
+        _models_cache = dict(zip(names, loaded))
         return _models_cache, _config_cache
     except FileNotFoundError as e:
         print(f"Warning: Models not found ({e}). Using fallback heuristics.")
         return None, None
 
 
+def _check_feature_order(models: list, feature_cols: list) -> None:
+    """
+    Validate the feature columns once at load time.
+    Predictions then feed the models plain float arrays in this order, so
+    the sklearn feature names are dropped to skip the per-call name check.
+    """
+    unknown = [col for col in feature_cols if col not in _FEATURE_SOURCES]
+    if unknown:
+        raise ValueError(f"Unknown features in features.json: {unknown}")
+    
+    for model in models:
+        trained_cols = getattr(model, 'feature_names_in_', None)
+        if trained_cols is None:
+            continue
+        if list(trained_cols) != list(feature_cols):
+            raise ValueError(f"Model features {list(trained_cols)} don't match features.json {feature_cols}")
+        del model.feature_names_in_
+
+
+class _OnnxModel:
+    """
+    Runs an exported model with ONNX Runtime behind sklearn's predict_proba API.
+    """
+    
+    def __init__(self, path: str):
+        self.session = ort.InferenceSession(path, providers=['CPUExecutionProvider'])
+        self.input_name = self.session.get_inputs()[0].name
+    
+    def predict_proba(self, X) -> np.ndarray:
+        x = np.asarray(X, dtype=np.float32)
+        # Outputs are [labels, probabilities] (exported with zipmap disabled)
+        return self.session.run(None, {self.input_name: x})[1]
+
+
+def _load_model(script_dir: str, name: str):
+    """
+    Load one market's model.
+    Prefers the ONNX export (model_<name>.onnx) when onnxruntime is installed,
+    otherwise the sklearn pickle, whose numpy arrays (if saved by joblib.dump)
+    are memory-mapped read-only so worker processes share one copy.
+    """
+    onnx_path = os.path.join(script_dir, f"model_{name}.onnx")
+    if ort is not None and os.path.exists(onnx_path):
+        return _OnnxModel(onnx_path)
+    
+    return joblib.load(os.path.join(script_dir, f"model_{name}.pkl"), mmap_mode='r')
+
+
 def load_historical_data():
     """
     Load historical match data for stats calculation.
     """
-    global _data_cache
+    global _data_cache, _data_version
     
     if _data_cache is not None:
         return _data_cache
@@ -60,18 +132,52 @@ def load_historical_data():
         script_dir = os.path.dirname(os.path.abspath(__file__))
         data_path = os.path.join(script_dir, 'master_data.csv')
         
-        df = pd.read_csv(data_path)
-        df['Date'] = pd.to_datetime(df['Date'], format='%d/%m/%Y', errors='coerce')
+        df = _read_match_data(data_path)
         df = df.sort_values('Date').reset_index(drop=True)
         _data_cache = df
+        _data_version = (id(df), os.path.getmtime(data_path))
+        get_team_index(df)
         return df
     except FileNotFoundError:
         return None
 
 
+def _read_match_data(csv_path: str) -> pd.DataFrame:
+    """
+    Read match data, preferring the up-to-date Parquet copy from merge_data.py.
+    """
+    parquet_path = os.path.splitext(csv_path)[0] + '.parquet'
+    try:
+        if os.path.getmtime(parquet_path) >= os.path.getmtime(csv_path):
+            return pd.read_parquet(parquet_path)
+    except (OSError, ImportError):
+        pass  # No Parquet copy (or no pyarrow): parse the CSV
+    
+    df = pd.read_csv(csv_path)
+    df['Date'] = pd.to_datetime(df['Date'], format='%d/%m/%Y', errors='coerce')
+    return df
+
+
+def get_team_index(df: pd.DataFrame):
+    """
+    Group df's rows by home team and by away team, once per DataFrame.
+    Lets get_team_stats fetch a team's games with a dict lookup instead
+    of scanning every row.
+    """
+    global _team_index
+    
+    if _team_index is None or _team_index[0] is not df:
+        home_groups = {name: g for name, g in df.groupby('HomeTeam', sort=False)}
+        away_groups = {name: g for name, g in df.groupby('AwayTeam', sort=False)}
+        _team_index = (df, home_groups, away_groups)
+    
+    return _team_index[1], _team_index[2]
+
+
 def get_team_stats(df: pd.DataFrame, team_name: str, is_home: bool, n_games: int = 5) -> dict:
     """
     Get comprehensive stats for a team from their last N games.
+    Results for the loaded historical data are memoized.
     """
     if df is None:
         return {
@@ -81,17 +187,41 @@ def get_team_stats(df: pd.DataFrame, team_name: str, is_home: bool, n_games: int
             'btts_rate': 50.0
         }
     
+    if df is _data_cache:
+        # Copy so callers can't mutate the memoized result
+        return dict(_team_stats_cached(team_name, is_home, n_games, _data_version))
+    
+    return _compute_team_stats(df, team_name, is_home, n_games)
+
+
+@functools.lru_cache(maxsize=256)
+def _team_stats_cached(team_name: str, is_home: bool, n_games: int, data_version) -> dict:
+    """
+    Memoized stats for the loaded historical data.
+    data_version is only part of the key, so a reload invalidates old entries.
+    """
+    return _compute_team_stats(_data_cache, team_name, is_home, n_games)
+
+
+def _compute_team_stats(df: pd.DataFrame, team_name: str, is_home: bool, n_games: int) -> dict:
+    """
+    Compute a team's stats from df (uncached).
+    """
+    home_groups, away_groups = get_team_index(df)
+    empty = df.iloc[:0]
+    team_home = home_groups.get(team_name, empty)
+    team_away = away_groups.get(team_name, empty)
+    
     # Get venue-specific games
-    if is_home:
-        venue_games = df[df['HomeTeam'] == team_name].tail(n_games)
-    else:
-        venue_games = df[df['AwayTeam'] == team_name].tail(n_games)
+    venue_only = (team_home if is_home else team_away).tail(n_games)
     
-    # Fallback to all games if not enough venue-specific
-    if len(venue_games) < 3:
-        venue_games = df[(df['HomeTeam'] == team_name) | (df['AwayTeam'] == team_name)].tail(n_games)
+    # Form uses all games if there aren't enough venue-specific ones
+    if len(venue_only) < 3:
+        form_games = pd.concat([team_home, team_away]).sort_index().tail(n_games)
+    else:
+        form_games = venue_only
     
-    if len(venue_games) == 0:
+    if len(form_games) == 0:
         return {
             'form': 7,
             'avg_goals': 1.3,
@@ -99,35 +229,29 @@ def get_team_stats(df: pd.DataFrame, team_name: str, is_home: bool, n_games: int
             'btts_rate': 50.0
         }
     
-    # Calculate form points
-    form = 0
-    for _, row in venue_games.iterrows():
-        is_home_game = row['HomeTeam'] == team_name
-        result = row['FTR']
-        if is_home_game:
-            if result == 'H': form += 3
-            elif result == 'D': form += 1
-        else:
-            if result == 'A': form += 3
-            elif result == 'D': form += 1
+    # Calculate form points (3 for a win, 1 for a draw) on the raw arrays
+    was_home = form_games['HomeTeam'].values == team_name
+    ftr = form_games['FTR'].values
+    wins = (was_home & (ftr == 'H')) | (~was_home & (ftr == 'A'))
+    form = int(3 * wins.sum() + (ftr == 'D').sum())
     
     # Calculate venue-specific goals
     if is_home:
-        home_games = df[df['HomeTeam'] == team_name].tail(n_games)
-        if len(home_games) > 0:
-            avg_goals = home_games['FTHG'].mean()
-            avg_conceded = home_games['FTAG'].mean()
-            btts_count = ((home_games['FTHG'] > 0) & (home_games['FTAG'] > 0)).sum()
-            btts_rate = (btts_count / len(home_games)) * 100
+        if len(venue_only) > 0:
+            fthg = venue_only['FTHG'].values
+            ftag = venue_only['FTAG'].values
+            avg_goals = fthg.mean()
+            avg_conceded = ftag.mean()
+            btts_rate = ((fthg > 0) & (ftag > 0)).mean() * 100
         else:
             avg_goals, avg_conceded, btts_rate = 1.3, 1.2, 50.0
     else:
-        away_games = df[df['AwayTeam'] == team_name].tail(n_games)
-        if len(away_games) > 0:
-            avg_goals = away_games['FTAG'].mean()
-            avg_conceded = away_games['FTHG'].mean()
-            btts_count = ((away_games['FTHG'] > 0) & (away_games['FTAG'] > 0)).sum()
-            btts_rate = (btts_count / len(away_games)) * 100
+        if len(venue_only) > 0:
+            fthg = venue_only['FTHG'].values
+            ftag = venue_only['FTAG'].values
+            avg_goals = ftag.mean()
+            avg_conceded = fthg.mean()
+            btts_rate = ((fthg > 0) & (ftag > 0)).mean() * 100
         else:
             avg_goals, avg_conceded, btts_rate = 1.1, 1.4, 50.0
     
@@ -144,39 +268,63 @@ def predict_match_ml(home_team: str, away_team: str) -> Dict[str, Any]:
     Predict match using trained ML models.
     Returns predictions for all 3 markets.
     """
+    return predict_matches_ml([(home_team, away_team)])[0]
+
+
+def predict_matches_ml(pairs: List[Tuple[str, str]]) -> List[Dict[str, Any]]:
+    """
+    Predict several matches at once.
+    All feature rows go through each model in a single predict_proba call,
+    so sklearn's per-call overhead is paid once per batch, not per match.
+    """
     models, config = load_models()
     df = load_historical_data()
     
     # If models not available, use fallback
     if models is None:
-        return predict_match_heuristic(home_team, away_team)
+        return predict_matches_heuristic(pairs)
+    
+    if not pairs:
+        return []
     
     # Get team stats
-    home_stats = get_team_stats(df, home_team, is_home=True)
-    away_stats = get_team_stats(df, away_team, is_home=False)
-    
-    # Prepare features for the model
-    # Matches the columns used during training (train_glitch.py)
-    feature_cols = config['features']
-    features = {
-        'HomeTeam_Form': home_stats['form'],          # Points from last 5 games (max 15)
-        'AwayTeam_Form': away_stats['form'],          # Points from last 5 games (max 15)
-        'Home_Avg_Goals': home_stats['avg_goals'],    # Attack strength
-        'Away_Avg_Goals': away_stats['avg_goals'],    # Attack strength
-        'Home_Avg_Conceded': home_stats['avg_conceded'], # Defense weakness
-        'Away_Avg_Conceded': away_stats['avg_conceded'], # Defense weakness
-        'Home_BTTS_Rate': home_stats['btts_rate'],    # % of recent games with BTTS
-        'Away_BTTS_Rate': away_stats['btts_rate']     # % of recent games with BTTS
-    }
+    team_stats = [
+        (get_team_stats(df, home, is_home=True), get_team_stats(df, away, is_home=False))
+        for home, away in pairs
+    ]
+    
+    # Build the feature matrix directly in features.json order
+    # (checked against the models once, in load_models)
+    sources = [_FEATURE_SOURCES[col] for col in config['features']]
+    X = np.array(
+        [
+            [(home_stats if side == 'home' else away_stats)[key] for side, key in sources]
+            for home_stats, away_stats in team_stats
+        ],
+        dtype=np.float32
+    )
     
-    # Convert to DataFrame for sklearn compatibility
-    X = pd.DataFrame([features])[feature_cols]
+    # One predict_proba per model for the whole batch
+    win_probas = models['win'].predict_proba(X)
+    goals_probas = models['goals'].predict_proba(X)
+    btts_probas = models['btts'].predict_proba(X)
     
+    return [
+        _build_ml_result(home, away, home_stats, away_stats,
+                         win_probas[i], goals_probas[i], btts_probas[i])
+        for i, ((home, away), (home_stats, away_stats)) in enumerate(zip(pairs, team_stats))
+    ]
+
+
+def _build_ml_result(home_team: str, away_team: str, home_stats: dict, away_stats: dict,
+                     win_proba, goals_proba, btts_proba) -> Dict[str, Any]:
+    """
+    Turn one match's model probabilities into the prediction dict.
+    """
     # Get predictions from all models
     predictions = {}
     
     # Model 1: Match Result
-    win_proba = models['win'].predict_proba(X)[0]
     predictions['win'] = {
         'home': win_proba[0] * 100,
         'draw': win_proba[1] * 100,
@@ -186,7 +334,6 @@ def predict_match_ml(home_team: str, away_team: str) -> Dict[str, Any]:
     }
     
     # Model 2: Over/Under 2.5 Goals
-    goals_proba = models['goals'].predict_proba(X)[0]
     predictions['goals'] = {
         'under': goals_proba[0] * 100,
         'over': goals_proba[1] * 100,
@@ -195,7 +342,6 @@ def predict_match_ml(home_team: str, away_team: str) -> Dict[str, Any]:
     }
     
     # Model 3: BTTS
-    btts_proba = models['btts'].predict_proba(X)[0]
     predictions['btts'] = {
         'no': btts_proba[0] * 100,
         'yes': btts_proba[1] * 100,
@@ -231,59 +377,104 @@ def predict_match_heuristic(home_team: str, away_team: str) -> Dict[str, Any]:
     """
     Fallback heuristic-based prediction when ML models aren't available.
     """
+    return predict_matches_heuristic([(home_team, away_team)])[0]
+
+
+def predict_matches_heuristic(pairs: List[Tuple[str, str]]) -> List[Dict[str, Any]]:
+    """
+    Heuristic predictions for several matches.
+    The arithmetic runs once over NumPy arrays for the whole batch; dicts
+    are only built at the end for the returned matches.
+    """
     df = load_historical_data()
     
-    home_stats = get_team_stats(df, home_team, is_home=True) if df is not None else {
-        'form': 7, 'avg_goals': 1.3, 'avg_conceded': 1.2, 'btts_rate': 50
-    }
-    away_stats = get_team_stats(df, away_team, is_home=False) if df is not None else {
-        'form': 7, 'avg_goals': 1.1, 'avg_conceded': 1.4, 'btts_rate': 50
-    }
+    team_stats = [
+        (
+            get_team_stats(df, home, is_home=True) if df is not None else {
+                'form': 7, 'avg_goals': 1.3, 'avg_conceded': 1.2, 'btts_rate': 50
+            },
+            get_team_stats(df, away, is_home=False) if df is not None else {
+                'form': 7, 'avg_goals': 1.1, 'avg_conceded': 1.4, 'btts_rate': 50
+            }
+        )
+        for home, away in pairs
+    ]
     
-    # Simple heuristic based on form
-    total_form = home_stats['form'] + away_stats['form']
-    if total_form == 0:
-        total_form = 1
-    
-    home_strength = home_stats['form'] / total_form
-    away_strength = away_stats['form'] / total_form
-    
-    # Predictions
-    predictions = {
-        'win': {
-            'home': home_strength * 100 * 1.1,  # Home advantage
-            'draw': 25,
-            'away': away_strength * 100 * 0.9,
-            'best': 'Home Win' if home_strength > away_strength else 'Away Win',
-            'confidence': max(home_strength, away_strength) * 100
-        },
-        'goals': {
-            'over': 50,
-            'under': 50,
-            'best': 'Over 2.5' if (home_stats['avg_goals'] + away_stats['avg_goals']) > 2.5 else 'Under 2.5',
-            'confidence': 52
-        },
-        'btts': {
-            'yes': (home_stats['btts_rate'] + away_stats['btts_rate']) / 2,
-            'no': 100 - (home_stats['btts_rate'] + away_stats['btts_rate']) / 2,
-            'best': 'BTTS Yes' if home_stats['btts_rate'] > 50 else 'BTTS No',
-            'confidence': 55
+    def column(side: int, key: str) -> np.ndarray:
+        return np.array([stats[side][key] for stats in team_stats], dtype=np.float64)
+    
+    markets = _heuristic_batch(
+        column(0, 'form'), column(1, 'form'),
+        column(0, 'avg_goals'), column(1, 'avg_goals'),
+        column(0, 'btts_rate'), column(1, 'btts_rate')
+    )
+    markets = {name: values.tolist() for name, values in markets.items()}
+    
+    results = []
+    for i, ((home_team, away_team), (home_stats, away_stats)) in enumerate(zip(pairs, team_stats)):
+        predictions = {
+            'win': {
+                'home': markets['win_home'][i],
+                'draw': 25,
+                'away': markets['win_away'][i],
+                'best': 'Home Win' if markets['home_favoured'][i] else 'Away Win',
+                'confidence': markets['win_confidence'][i]
+            },
+            'goals': {
+                'over': 50,
+                'under': 50,
+                'best': 'Over 2.5' if markets['over'][i] else 'Under 2.5',
+                'confidence': 52
+            },
+            'btts': {
+                'yes': markets['btts_yes'][i],
+                'no': markets['btts_no'][i],
+                'best': 'BTTS Yes' if markets['btts_likely'][i] else 'BTTS No',
+                'confidence': 55
+            }
         }
-    }
+        
+        results.append({
+            'match': f"{home_team} vs {away_team}",
+            'home_team': home_team,
+            'away_team': away_team,
+            'predictions': predictions,
+            'safest_glitch': {
+                'market': 'Match Result',
+                'bet': predictions['win']['best'],
+                'confidence': predictions['win']['confidence']
+            },
+            'home_stats': home_stats,
+            'away_stats': away_stats,
+            'using_ml': False
+        })
+    
+    return results
+
+
+def _heuristic_batch(home_form: np.ndarray, away_form: np.ndarray,
+                     home_goals: np.ndarray, away_goals: np.ndarray,
+                     home_btts: np.ndarray, away_btts: np.ndarray) -> Dict[str, np.ndarray]:
+    """
+    Vectorized heuristic: per-match stat arrays in, per-market arrays out.
+    """
+    # Simple heuristic based on form
+    total_form = home_form + away_form
+    total_form = np.where(total_form == 0, 1, total_form)
+    
+    home_strength = home_form / total_form
+    away_strength = away_form / total_form
+    btts_yes = (home_btts + away_btts) / 2
     
     return {
-        'match': f"{home_team} vs {away_team}",
-        'home_team': home_team,
-        'away_team': away_team,
-        'predictions': predictions,
-        'safest_glitch': {
-            'market': 'Match Result',
-            'bet': predictions['win']['best'],
-            'confidence': predictions['win']['confidence']
-        },
-        'home_stats': home_stats,
-        'away_stats': away_stats,
-        'using_ml': False
+        'win_home': home_strength * 100 * 1.1,  # Home advantage
+        'win_away': away_strength * 100 * 0.9,
+        'home_favoured': home_strength > away_strength,
+        'win_confidence': np.maximum(home_strength, away_strength) * 100,
+        'over': (home_goals + away_goals) > 2.5,
+        'btts_yes': btts_yes,
+        'btts_no': 100 - btts_yes,
+        'btts_likely': home_btts > 50
     }
 
 
@@ -8,7 +8,14 @@ Run: python main.py
 
 import os
 import re
+import sys
+import asyncio
+import bisect
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from cachetools import TTLCache
 from datetime import datetime, timedelta
+from typing import Optional
 from dotenv import load_dotenv
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import Application, CommandHandler, CallbackQueryHandler, MessageHandler, filters, ContextTypes
@@ -16,7 +23,8 @@ from telegram.constants import ParseMode
 
 # Import modules
 import predict_glitch
-from data_manager import get_headers, API_FOOTBALL_BASE, fetch_fixtures_with_cache
+from data_manager import get_headers, API_FOOTBALL_BASE, fetch_fixtures_with_source, fetch_fixtures_batch
+from utils import _ZeroDefault
 import requests
 from keep_alive import keep_alive
 
@@ -29,6 +37,27 @@ LEAGUES = {
     140: {'name': 'La Liga', 'flag': '🇪🇸', 'country': 'Spain'},
 }
 
+# Static keyboards, built once (PTB markup objects are immutable, so they can be shared)
+_LEAGUE_MARKUP = InlineKeyboardMarkup([
+    [InlineKeyboardButton(f"{info['flag']} {info['name']}", callback_data=f"league_{league_id}")]
+    for league_id, info in LEAGUES.items()
+])
+_BACK_MARKUP = InlineKeyboardMarkup([[InlineKeyboardButton("⬅️ Back", callback_data="back_menu")]])
+_BACK_TO_MATCHES_MARKUP = InlineKeyboardMarkup([[InlineKeyboardButton("⬅️ Back to Matches", callback_data="back_menu")]])
+_BACK_TO_LEAGUES_ROW = (InlineKeyboardButton("⬅️ Back to Leagues", callback_data="back_menu"),)
+
+# One in-flight fixture fetch per league; other taps wait for it and then read the cache
+_FIXTURE_LOCKS = defaultdict(asyncio.Lock)
+
+# Rendered fixture pages: league_id -> (text, reply_markup), reused for 5 min
+_LEAGUE_PAGE_CACHE = TTLCache(maxsize=32, ttl=300)
+
+# Worker threads for predictions, so a slow one doesn't block other users' handlers
+_PRED_POOL = ThreadPoolExecutor(max_workers=4, thread_name_prefix='predict')
+
+# Day abbreviations for fixture buttons (same as strftime's '%a' in the C locale)
+_WEEKDAYS = ('Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat', 'Sun')
+
 # (get_current_season removal)
 # (fetch_fixtures removal)
 
@@ -41,39 +70,60 @@ def format_fixture_button(fixture: dict) -> str:
     """
     home = fixture['home_team']
     away = fixture['away_team']
-    time = fixture['time']
     
     # Shorten long team names
     home = shorten_team_name(home)
     away = shorten_team_name(away)
     
-    # Get day and date
+    # Get day, date and kick-off time from the ISO datetime
+    # (entries cached before 'datetime' was the only field still carry 'date'/'time')
+    iso = fixture.get('datetime') or f"{fixture.get('date', '')}T{fixture.get('time', '')}"
+    time = iso[11:16] or "00:00"  # No kick-off time given
     try:
-        date_obj = datetime.strptime(fixture['date'], '%Y-%m-%d')
-        day_date = date_obj.strftime('%a %d/%m')
-    except:
+        date_obj = datetime.fromisoformat(iso[:10])
+        day_date = f"{_WEEKDAYS[date_obj.weekday()]} {date_obj.day:02d}/{date_obj.month:02d}"
+    except ValueError:
         day_date = ""
     
     return f"{home} vs {away} ({day_date} {time})"
 
 
+# Long API team names -> short button labels
+TEAM_SHORT_NAMES = {
+    'Manchester United': 'Man Utd',
+    'Manchester City': 'Man City',
+    'Nottingham Forest': "Nott'm Forest",
+    'Brighton and Hove Albion': 'Brighton',
+    'Wolverhampton Wanderers': 'Wolves',
+    'West Ham United': 'West Ham',
+    'Newcastle United': 'Newcastle',
+    'Tottenham Hotspur': 'Tottenham',
+    'Athletic Club': 'Athletic',
+    'Atletico Madrid': 'Atlético',
+    'Real Sociedad': 'Real Sociedad',
+    'Deportivo Alavés': 'Alavés',
+}
+
+# One alternation over all long names, longest first so e.g.
+# 'Manchester United' wins over any shorter overlapping rule
+_SHORTEN_RE = re.compile('|'.join(
+    re.escape(name) for name in sorted(TEAM_SHORT_NAMES, key=len, reverse=True)
+))
+
+
 def shorten_team_name(name: str) -> str:
     """Shorten long team names for buttons."""
-    replacements = {
-        'Manchester United': 'Man Utd',
-        'Manchester City': 'Man City',
-        'Nottingham Forest': "Nott'm Forest",
-        'Brighton and Hove Albion': 'Brighton',
-        'Wolverhampton Wanderers': 'Wolves',
-        'West Ham United': 'West Ham',
-        'Newcastle United': 'Newcastle',
-        'Tottenham Hotspur': 'Tottenham',
-        'Athletic Club': 'Athletic',
-        'Atletico Madrid': 'Atlético',
-        'Real Sociedad': 'Real Sociedad',
-        'Deportivo Alavés': 'Alavés',
-    }
-    return replacements.get(name, name)
+    return _SHORTEN_RE.sub(lambda m: TEAM_SHORT_NAMES[m.group(0)], name)
+
+
+class _AsciiAlphaTable(dict):
+    """str.translate table that keeps only ASCII letters (like [^a-zA-Z] -> '')."""
+    
+    def __missing__(self, key):
+        return None  # Non-ASCII characters are dropped too
+
+
+_KEEP_ALPHA = _AsciiAlphaTable({c: (c if chr(c).isalpha() else None) for c in range(128)})
 
 
 # =============================================================================
@@ -124,6 +174,32 @@ def generate_pidgin_commentary(result: dict) -> str:
     return "📊 Odds dey favor this pick, but football na football. Manage am!"
 
 
+def team_callback_token(name: str) -> str:
+    """
+    Callback token for a team: its position in the sorted team names from the
+    match history (exact, and short enough for Telegram's 64-byte limit),
+    else the cleaned name as before.
+    """
+    names = predict_glitch.TEAM_NAMES
+    i = bisect.bisect_left(names, name)
+    if i < len(names) and names[i] == name:
+        return str(i)
+    return name.translate(_KEEP_ALPHA)[:12]
+
+
+def resolve_team_token(token: str) -> Optional[str]:
+    """
+    Turn a callback token back into a team name (cleaned names are never digits).
+    Returns None for an id that isn't in the team list.
+    """
+    if not token.isdigit():
+        return token
+    team_id = int(token)
+    if team_id < len(predict_glitch.TEAM_NAMES):
+        return predict_glitch.TEAM_NAMES[team_id]
+    return None
+
+
 # =============================================================================
 # BOT HANDLERS
 # =============================================================================
@@ -132,17 +208,6 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """
     Handle /start and /glitch - Show league selection menu.
     """
-    keyboard = []
-    for league_id, info in LEAGUES.items():
-        keyboard.append([
-            InlineKeyboardButton(
-                f"{info['flag']} {info['name']}", 
-                callback_data=f"league_{league_id}"
-            )
-        ])
-    
-    reply_markup = InlineKeyboardMarkup(keyboard)
-    
     message = """
 👋 *Welcome to PROJECT GLITCH*
 _Your AI-Powered Betting Intelligence_
@@ -156,7 +221,7 @@ _Your AI-Powered Betting Intelligence_
     
     await update.message.reply_text(
         message, 
-        reply_markup=reply_markup,
+        reply_markup=_LEAGUE_MARKUP,
         parse_mode=ParseMode.MARKDOWN
     )
 
@@ -175,12 +240,18 @@ async def button_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
         league_id = int(data.split('_')[1])
         await show_fixtures(query, league_id)
     
-    # Match prediction (p_HomeTeam_AwayTeam)
+    # Match prediction (p_HomeId_AwayId, or p_HomeTeam_AwayTeam)
     elif data.startswith('p_'):
         parts = data.split('_')
         if len(parts) >= 3:
-            home_team = parts[1]
-            away_team = parts[2]
+            home_team = resolve_team_token(parts[1])
+            away_team = resolve_team_token(parts[2])
+            if home_team is None or away_team is None:
+                await query.edit_message_text(
+                    "❌ Unknown team in this match button. Please pick the match again.",
+                    reply_markup=_BACK_MARKUP
+                )
+                return
             await show_prediction(query, home_team, away_team)
     
     # Legacy predict_ format
@@ -198,40 +269,36 @@ async def button_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
 
 async def show_main_menu(query) -> None:
     """Show main league menu."""
-    keyboard = []
-    for league_id, info in LEAGUES.items():
-        keyboard.append([
-            InlineKeyboardButton(
-                f"{info['flag']} {info['name']}", 
-                callback_data=f"league_{league_id}"
-            )
-        ])
-    
-    reply_markup = InlineKeyboardMarkup(keyboard)
-    
     await query.edit_message_text(
         "🔮 *PROJECT GLITCH*\n\n*Select your league:*",
-        reply_markup=reply_markup,
+        reply_markup=_LEAGUE_MARKUP,
         parse_mode=ParseMode.MARKDOWN
     )
 
 
 async def show_fixtures(query, league_id: int) -> None:
     """Show upcoming fixtures for a league."""
+    page = _LEAGUE_PAGE_CACHE.get(league_id)
+    if page is not None:
+        text, reply_markup = page
+        await query.edit_message_text(text, reply_markup=reply_markup, parse_mode=ParseMode.MARKDOWN)
+        return
+    
     league_info = LEAGUES.get(league_id, {'name': 'Unknown', 'flag': '⚽'})
     
     await query.edit_message_text(
         f"🔄 Loading {league_info['flag']} {league_info['name']} fixtures..."
     )
     
-    # Fetch next 10 matches (with caching + fallback)
-    fixtures = fetch_fixtures_with_cache(league_id, count=10)
+    # Fetch next 10 matches (with caching + fallback) off the event loop
+    async with _FIXTURE_LOCKS[league_id]:
+        loop = asyncio.get_running_loop()
+        fixtures, is_live = await loop.run_in_executor(None, fetch_fixtures_with_source, league_id, 10)
     
     if not fixtures:
-        keyboard = [[InlineKeyboardButton("⬅️ Back", callback_data="back_menu")]]
         await query.edit_message_text(
             f"{league_info['flag']} *{league_info['name']}*\n\n❌ No upcoming fixtures found.",
-            reply_markup=InlineKeyboardMarkup(keyboard),
+            reply_markup=_BACK_MARKUP,
             parse_mode=ParseMode.MARKDOWN
         )
         return
@@ -239,22 +306,25 @@ async def show_fixtures(query, league_id: int) -> None:
     # Create buttons for each fixture
     keyboard = []
     for fixture in fixtures[:12]:  # Limit to 12 matches
-        # Create callback data - use team names directly
-        home_clean = re.sub(r'[^a-zA-Z]', '', fixture['home_team'])[:12]
-        away_clean = re.sub(r'[^a-zA-Z]', '', fixture['away_team'])[:12]
-        callback = f"p_{home_clean}_{away_clean}"
+        # Create callback data - team ids, or cleaned names for teams we have no history for
+        callback = f"p_{team_callback_token(fixture['home_team'])}_{team_callback_token(fixture['away_team'])}"
         
         button_text = format_fixture_button(fixture)
         keyboard.append([InlineKeyboardButton(button_text, callback_data=callback)])
     
-    keyboard.append([InlineKeyboardButton("⬅️ Back to Leagues", callback_data="back_menu")])
+    keyboard.append(_BACK_TO_LEAGUES_ROW)
     
     reply_markup = InlineKeyboardMarkup(keyboard)
-    
-    await query.edit_message_text(
+    text = (
         f"{league_info['flag']} *{league_info['name']}*\n"
         f"📅 Next {len(fixtures)} matches\n\n"
-        f"*Tap a match to get prediction:*",
+        f"*Tap a match to get prediction:*"
+    )
+    if is_live:  # Never keep the mock fallback, so the next tap retries the API
+        _LEAGUE_PAGE_CACHE[league_id] = (text, reply_markup)
+    
+    await query.edit_message_text(
+        text,
         reply_markup=reply_markup,
         parse_mode=ParseMode.MARKDOWN
     )
@@ -271,90 +341,53 @@ async def show_prediction(query, home_team: str, away_team: str) -> None:
     )
     
     try:
-        # Get prediction
-        result = predict_glitch.predict_all_markets(home_team, away_team)
+        # Get prediction (off the event loop)
+        loop = asyncio.get_running_loop()
+        result = await loop.run_in_executor(
+            _PRED_POOL, predict_glitch.predict_all_markets, home_team, away_team
+        )
         
         # Format output
         output = format_prediction_output(result, home_team, away_team)
         
-        # Back button
-        keyboard = [[InlineKeyboardButton("⬅️ Back to Matches", callback_data="back_menu")]]
-        reply_markup = InlineKeyboardMarkup(keyboard)
-        
         await query.edit_message_text(
             output,
-            reply_markup=reply_markup,
+            reply_markup=_BACK_TO_MATCHES_MARKUP,
             parse_mode=ParseMode.MARKDOWN
         )
     
     except Exception as e:
-        keyboard = [[InlineKeyboardButton("⬅️ Back", callback_data="back_menu")]]
         await query.edit_message_text(
             f"❌ Error getting prediction: {e}",
-            reply_markup=InlineKeyboardMarkup(keyboard)
+            reply_markup=_BACK_MARKUP
         )
 
 
-def format_prediction_output(result: dict, home: str, away: str) -> str:
-    """Format the final prediction output with Pidgin commentary."""
-    
-    # Check if skipped
-    if result.get('skipped'):
-        return f"""
+# Reply templates, filled with a single format_map each
+_SKIPPED_TPL = """
 ⚠️ *MATCH SKIPPED*
 ━━━━━━━━━━━━━━━━━━━━━━
 ⚽ *{home} vs {away}*
 
 🚫 *HIGH VARIANCE ALERT*
-{result.get('skip_reason', 'Too many key players missing')}
+{skip_reason}
 
 ━━━━━━━━━━━━━━━━━━━━━━
 🗣 *GLITCH SAYS:*
-_{generate_pidgin_commentary(result)}_
+_{commentary}_
 """
-    
-    safest = result.get('safest_glitch', {})
-    preds = result.get('predictions', {})
-    
-    confidence = safest.get('confidence', 0)
-    implied_odds = 100 / confidence if confidence > 0 else 0
-    
-    # Get current time
-    now = datetime.now().strftime("%d %b %Y | %H:%M")
-    
-    # Build output
-    output = f"""
+
+_PREDICTION_TPL = """
 📅 *{now}*
 ⚽ *{home} vs {away}*
 ━━━━━━━━━━━━━━━━━━━━━━
 
-🎯 *SIGNAL:* {safest.get('bet', 'N/A')}
+🎯 *SIGNAL:* {bet}
 📊 *CONFIDENCE:* {confidence:.0f}%
 📉 *IMPLIED ODDS:* {implied_odds:.2f}
 
 ━━━━━━━━━━━━━━━━━━━━━━
-"""
-    
-    # Market breakdown
-    if 'win' in preds:
-        win = preds['win']
-        output += f"""
-🏆 *Result:* H {win.get('home', 0):.0f}% | D {win.get('draw', 0):.0f}% | A {win.get('away', 0):.0f}%"""
-    
-    if 'goals' in preds:
-        goals = preds['goals']
-        output += f"""
-⚽ *Goals:* Over {goals.get('over', 0):.0f}% | Under {goals.get('under', 0):.0f}%"""
-    
-    if 'btts' in preds:
-        btts = preds['btts']
-        output += f"""
-🥅 *BTTS:* Yes {btts.get('yes', 0):.0f}% | No {btts.get('no', 0):.0f}%"""
-    
-    # Pidgin commentary
-    commentary = generate_pidgin_commentary(result)
-    
-    output += f"""
+{markets}
 
 ━━━━━━━━━━━━━━━━━━━━━━
 🗣 *GLITCH SAYS:*
@@ -362,8 +395,45 @@ _{commentary}_
 ━━━━━━━━━━━━━━━━━━━━━━
 _For entertainment only_ 🎰
 """
+
+# Market breakdown lines, only added for markets present in the result
+_MARKET_TPLS = (
+    ('win', "\n🏆 *Result:* H {home:.0f}% | D {draw:.0f}% | A {away:.0f}%"),
+    ('goals', "\n⚽ *Goals:* Over {over:.0f}% | Under {under:.0f}%"),
+    ('btts', "\n🥅 *BTTS:* Yes {yes:.0f}% | No {no:.0f}%"),
+)
+
+
+def format_prediction_output(result: dict, home: str, away: str) -> str:
+    """Format the final prediction output with Pidgin commentary."""
+    
+    # Check if skipped
+    if result.get('skipped'):
+        return _SKIPPED_TPL.format_map({
+            'home': home,
+            'away': away,
+            'skip_reason': result.get('skip_reason', 'Too many key players missing'),
+            'commentary': generate_pidgin_commentary(result)
+        })
+    
+    safest = result.get('safest_glitch', {})
+    preds = result.get('predictions', {})
+    
+    confidence = safest.get('confidence', 0)
     
-    return output
+    return _PREDICTION_TPL.format_map({
+        'now': datetime.now().strftime("%d %b %Y | %H:%M"),
+        'home': home,
+        'away': away,
+        'bet': safest.get('bet', 'N/A'),
+        'confidence': confidence,
+        'implied_odds': 100 / confidence if confidence > 0 else 0,
+        'markets': ''.join(
+            tpl.format_map(_ZeroDefault(preds[market]))
+            for market, tpl in _MARKET_TPLS if market in preds
+        ),
+        'commentary': generate_pidgin_commentary(result)
+    })
 
 
 # =============================================================================
@@ -381,6 +451,22 @@ def main() -> None:
     
     print("🟢 Starting The Glitch Bot (Interactive Mode)...")
     
+    # Warm the fixtures cache for every league in one parallel pass
+    fetch_fixtures_batch(list(LEAGUES))
+    
+    # Load models and match history now so the first prediction doesn't pay for it
+    predict_glitch.load_models()
+    predict_glitch.load_historical_data()
+    
+    # Use uvloop's faster event loop when it's installed (it doesn't support Windows)
+    if sys.platform != 'win32':
+        try:
+            import uvloop
+            asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+            print("⚡ Using uvloop event loop")
+        except ImportError:
+            pass
+    
     # Build application
     application = Application.builder().token(token).build()
     
@@ -392,9 +478,21 @@ def main() -> None:
     # Handle any text message (Hi, Abeg, Update, etc.) - shows main menu
     application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, start))
     
-    # Run
-    print("🤖 Bot is running with BUTTON UI. Press Ctrl+C to stop.")
-    application.run_polling(allowed_updates=Update.ALL_TYPES)
+    # Run: webhook when a public URL is configured, otherwise long polling
+    webhook_url = os.getenv("WEBHOOK_URL")
+    if webhook_url:
+        port = int(os.getenv("PORT", "8443"))
+        print(f"🤖 Bot is running with BUTTON UI (webhook on port {port}). Press Ctrl+C to stop.")
+        application.run_webhook(
+            listen="0.0.0.0",
+            port=port,
+            url_path=token,
+            webhook_url=f"{webhook_url.rstrip('/')}/{token}",
+            allowed_updates=Update.ALL_TYPES
+        )
+    else:
+        print("🤖 Bot is running with BUTTON UI. Press Ctrl+C to stop.")
+        application.run_polling(allowed_updates=Update.ALL_TYPES)
 
 
 if __name__ == "__main__":
@@ -5,6 +5,7 @@ Supports: EPL (E0, E1), La Liga (SP1, SP2), and more.
 
 import os
 import glob
+import numpy as np
 import pandas as pd
 from pathlib import Path
 
@@ -43,25 +44,8 @@ def get_league_from_filename(filename: str) -> dict:
     return {'name': 'Unknown', 'id': 0, 'country': 'Unknown'}
 
 
-def normalize_date(date_str: str) -> str:
-    """
-    Normalize date format to DD/MM/YYYY.
-    Handles both 2-digit years ('23') and 4-digit years ('2023').
-    """
-    if not isinstance(date_str, str):
-        return date_str
-    
-    parts = date_str.split('/')
-    if len(parts) != 3:
-        return date_str
-    
-    day, month, year = parts
-    
-    # Convert 2-digit year to 4-digit
-    if len(year) == 2:
-        year = f"20{year}"
-    
-    return f"{day}/{month}/{year}"
+# Two-digit years are normalized to DD/MM/YYYY: 'DD/MM/YY' -> 'DD/MM/20YY'
+TWO_DIGIT_YEAR = r'^([^/]*/[^/]*/)(\d{2})$'
 
 
 def merge_csv_files(data_folder: str = "data", output_file: str = "master_data.csv"):
@@ -90,19 +74,15 @@ def merge_csv_files(data_folder: str = "data", output_file: str = "master_data.c
     # Read and combine all CSVs
     all_dataframes = []
     league_counts = {}
+    file_leagues = []
     
     for csv_file in sorted(csv_files):
         try:
-            df = pd.read_csv(csv_file, encoding='utf-8', low_memory=False)
+            df = pd.read_csv(csv_file, encoding='utf-8', low_memory=False, dtype={'Date': 'str'})
             
-            # Get league info from filename
+            # Get league info from filename (columns are added after the concat)
             league_info = get_league_from_filename(csv_file.name)
-            
-            # Add league columns
-            df['League'] = league_info['name']
-            df['League_ID'] = league_info['id']
-            df['Country'] = league_info['country']
-            df['_source_file'] = csv_file.name
+            file_leagues.append(league_info)
             
             all_dataframes.append(df)
             
@@ -132,36 +112,34 @@ def merge_csv_files(data_folder: str = "data", output_file: str = "master_data.c
     print("\n🔄 Merging dataframes...")
     master_df = pd.concat(all_dataframes, ignore_index=True)
     
+    # Add league columns in one go, after the first file's columns as before
+    lengths = [len(df) for df in all_dataframes]
+    league_df = pd.DataFrame({
+        column: pd.Categorical(np.repeat([info[key] for info in file_leagues], lengths))
+        for column, key in [('League', 'name'), ('League_ID', 'id'), ('Country', 'country')]
+    })
+    columns = list(master_df.columns)
+    first_cols = len(all_dataframes[0].columns)
+    columns[first_cols:first_cols] = list(league_df.columns)
+    master_df = pd.concat([master_df, league_df], axis=1)[columns]
+    
     # Fix date format
     if 'Date' in master_df.columns:
         print("📅 Normalizing date formats...")
-        master_df['Date'] = master_df['Date'].apply(normalize_date)
-        
-        # Convert to datetime for proper sorting
-        master_df['_date_parsed'] = pd.to_datetime(
-            master_df['Date'], 
-            format='%d/%m/%Y', 
-            errors='coerce'
-        )
+        master_df['Date'] = master_df['Date'].str.replace(TWO_DIGIT_YEAR, r'\g<1>20\2', regex=True)
         
         # Sort by date
         print("📊 Sorting by date...")
-        master_df = master_df.sort_values('_date_parsed', ascending=True)
-        
-        # Remove helper column
-        master_df = master_df.drop(columns=['_date_parsed'])
-    
-    # Remove source file tracking column before saving
-    if '_source_file' in master_df.columns:
-        master_df = master_df.drop(columns=['_source_file'])
+        parsed = pd.to_datetime(master_df['Date'], format='%d/%m/%Y', errors='coerce')
+        master_df = master_df.loc[parsed.sort_values(ascending=True).index]
     
     # Remove duplicates
     initial_rows = len(master_df)
-    if all(col in master_df.columns for col in ['Date', 'HomeTeam', 'AwayTeam', 'League_ID']):
-        master_df = master_df.drop_duplicates(
-            subset=['Date', 'HomeTeam', 'AwayTeam', 'League_ID'], 
-            keep='first'
-        )
+    dedup_cols = ['Date', 'HomeTeam', 'AwayTeam', 'League_ID']
+    if all(col in master_df.columns for col in dedup_cols):
+        # One 64-bit hash per row, then dedup that single uint64 column
+        row_keys = pd.util.hash_pandas_object(master_df[dedup_cols], index=False)
+        master_df = master_df.loc[~row_keys.duplicated(keep='first')]
         removed = initial_rows - len(master_df)
         if removed > 0:
             print(f"🗑️ Removed {removed} duplicate rows")
@@ -169,9 +147,24 @@ def merge_csv_files(data_folder: str = "data", output_file: str = "master_data.c
     # Save to file
     master_df.to_csv(output_file, index=False)
     
+    # Typed Parquet copy (dates already parsed) so loaders can skip the CSV parse
+    parquet_file = os.path.splitext(output_file)[0] + '.parquet'
+    try:
+        parquet_df = master_df
+        if 'Date' in master_df.columns:
+            parquet_df = master_df.assign(
+                Date=pd.to_datetime(master_df['Date'], format='%d/%m/%Y', errors='coerce')
+            )
+        parquet_df.to_parquet(parquet_file, compression='zstd', index=False)
+    except ImportError:
+        parquet_file = None
+        print("⚠️ pyarrow not installed - skipping Parquet copy")
+    
     print(f"\n{'═' * 50}")
     print(f"✨ Success! Merged {len(master_df)} rows of data.")
     print(f"📁 Saved to: {output_file}")
+    if parquet_file:
+        print(f"📁 Saved to: {parquet_file}")
     print(f"{'═' * 50}")
     
     # Show final stats
@@ -0,0 +1,15 @@
+"""
+Numba Shim - Optional JIT Compilation
+=====================================
+Exports numba's njit when it's installed, else a no-op decorator, so the
+stats kernels in predict_glitch.py and train_glitch.py run as plain Python.
+"""
+
+try:
+    from numba import njit
+except ImportError:
+    def njit(*args, **kwargs):
+        """No-op stand-in for numba.njit (bare @njit or @njit(...))."""
+        if len(args) == 1 and callable(args[0]):
+            return args[0]
+        return lambda func: func
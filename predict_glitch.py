@@ -12,31 +12,74 @@ Usage: python predict_glitch.py "Arsenal" "Liverpool"
 """
 
 import sys
-import json
-import pickle
+import threading
 import pandas as pd
 import numpy as np
+import joblib
+import orjson
 from collections import defaultdict
+from cachetools import TTLCache
+from glitch_engine import _read_match_data, _check_feature_order
+from numba_shim import njit  # Plain Python when numba isn't installed
+
+
+# Stats for teams with no match history
+DEFAULT_STATS = {
+    'form': 7,
+    'avg_goals': 1.3,
+    'avg_conceded': 1.2,
+    'btts_rate': 50.0
+}
+
+# Precomputed per-team stats (last STATS_WINDOW games), built by build_team_stats_cache
+STATS_WINDOW = 5
+HOME_STATS = {}
+AWAY_STATS = {}
+_stats_df = None  # DataFrame the tables above were built from
+
+# The same matches as a struct of arrays: team ids, int8 scores, FTR as 0/1/2 (H/D/A)
+TEAM_IDX = {}
+TEAM_NAMES = []  # Sorted team names (stable positions for bot callback tokens)
+MATCH_ARRAYS = {}
+FTR_CODES = {'H': 0, 'D': 1, 'A': 2}
+
+# Loaded models and data (only successful loads are kept)
+_models_cache = None  # (models, config)
+_data_cache = {}  # data_path -> DataFrame
+
+# Recent predictions keyed on (home_team, away_team, check_squad), kept 30 min
+PREDICTION_TTL = 1800
+_PRED_CACHE = TTLCache(maxsize=512, ttl=PREDICTION_TTL)
+_PRED_LOCK = threading.Lock()  # TTLCache isn't thread-safe
 
 
 def load_models():
     """
     Load all trained models and configuration.
+    Cached: files are read once per process (a failed load is retried next call).
     """
+    global _models_cache
+    
+    if _models_cache is not None:
+        return _models_cache
+    
     try:
         import os
         script_dir = os.path.dirname(os.path.abspath(__file__))
         
-        with open(os.path.join(script_dir, 'features.json'), 'r') as f:
-            config = json.load(f)
+        with open(os.path.join(script_dir, 'features.json'), 'rb') as f:
+            config = orjson.loads(f.read())
         
+        # mmap_mode maps the tree arrays of joblib-saved models instead of copying them
         models = {}
         for name in ['win', 'goals', 'btts']:
             model_path = os.path.join(script_dir, f"model_{name}.pkl")
-            with open(model_path, 'rb') as f:
-                models[name] = pickle.load(f)
+            models[name] = joblib.load(model_path, mmap_mode='r')
+        
+        _check_feature_order(list(models.values()), config['features'])
         
-        return models, config
+        _models_cache = (models, config)
+        return _models_cache
     except FileNotFoundError as e:
         return None, None
 
@@ -57,24 +100,181 @@ def get_best_prediction():
 def load_historical_data(data_path='master_data.csv'):
     """
     Load and prepare historical match data.
+    Cached: the data is read (dates converted, rows sorted) once per process
+    (a missing file is retried next call).
+    Uses the typed Parquet copy from merge_data.py when it's up to date.
     """
+    if data_path in _data_cache:
+        return _data_cache[data_path]
+    
     try:
         import os
         script_dir = os.path.dirname(os.path.abspath(__file__))
         full_path = os.path.join(script_dir, data_path)
         
-        df = pd.read_csv(full_path)
-        df['Date'] = pd.to_datetime(df['Date'], format='%d/%m/%Y', errors='coerce')
+        df = _read_match_data(full_path)
         df = df.sort_values('Date').reset_index(drop=True)
+        build_team_stats_cache(df)
+        _data_cache[data_path] = df
         return df
     except FileNotFoundError:
         print(f"❌ Error: {data_path} not found!")
         return None
 
 
-def get_team_stats(df: pd.DataFrame, team_name: str, is_home: bool, n_games: int = 5) -> dict:
+def build_team_stats_cache(df: pd.DataFrame, n_games: int = STATS_WINDOW) -> None:
+    """
+    Precompute every team's home and away stats from df.
+    After this, get_team_stats on the same df is a dict lookup.
+    """
+    global _stats_df
+    
+    HOME_STATS.clear()
+    AWAY_STATS.clear()
+    with _PRED_LOCK:
+        _PRED_CACHE.clear()  # Cached predictions used the old stats
+    
+    build_match_arrays(df)
+    arrays = MATCH_ARRAYS
+    for team, team_id in TEAM_IDX.items():
+        all_idx = np.flatnonzero((arrays['home_id'] == team_id) | (arrays['away_id'] == team_id))
+        HOME_STATS[team] = _stats_from_kernel(_stats_kernel(
+            arrays['home_rows'][team_id], all_idx, arrays['home_id'], team_id,
+            arrays['fthg'], arrays['ftag'], arrays['ftr'], True, n_games
+        ), True)
+        AWAY_STATS[team] = _stats_from_kernel(_stats_kernel(
+            arrays['away_rows'][team_id], all_idx, arrays['home_id'], team_id,
+            arrays['fthg'], arrays['ftag'], arrays['ftr'], False, n_games
+        ), False)
+    _stats_df = df
+
+
+def build_match_arrays(df: pd.DataFrame) -> None:
+    """
+    Fill TEAM_IDX and MATCH_ARRAYS from df (rows in date order).
+    Per-team row positions are stored too, so stats never touch pandas or strings.
+    """
+    n_rows = len(df)
+    codes, teams = pd.factorize(
+        np.concatenate([df['HomeTeam'].to_numpy(), df['AwayTeam'].to_numpy()])
+    )
+    home_id = codes[:n_rows].astype(np.int16)
+    away_id = codes[n_rows:].astype(np.int16)
+    
+    TEAM_IDX.clear()
+    TEAM_IDX.update((name, i) for i, name in enumerate(teams))
+    TEAM_NAMES[:] = sorted(teams)
+    MATCH_ARRAYS.clear()
+    MATCH_ARRAYS.update({
+        'home_id': home_id,
+        'away_id': away_id,
+        'fthg': _score_array(df['FTHG']),
+        'ftag': _score_array(df['FTAG']),
+        'ftr': df['FTR'].map(FTR_CODES).fillna(-1).to_numpy(dtype=np.int8),
+        'home_rows': [np.flatnonzero(home_id == i) for i in range(len(teams))],
+        'away_rows': [np.flatnonzero(away_id == i) for i in range(len(teams))],
+    })
+
+
+def _score_array(scores: pd.Series) -> np.ndarray:
+    """Goals as int8, or float64 if any are missing (the kernel skips NaN)."""
+    if scores.isna().any():
+        return scores.to_numpy(dtype=np.float64)
+    return scores.to_numpy(dtype=np.int8)
+
+
+@njit(cache=True)
+def _stats_kernel(venue_idx, all_idx, home_id, team_id, fthg, ftag, ftr, is_home, n):
+    """
+    Form and goal totals for one team over its last n games.
+    venue_idx/all_idx are row positions in date order; ftr is H/D/A as 0/1/2.
+    Returns (form_games, form, goals_sum, goals_n, conceded_sum, conceded_n, btts, goal_games).
+    """
+    # Form: last n venue games, or last n games anywhere if there aren't enough
+    form = 0
+    if len(venue_idx) >= n:
+        form_games = n
+        for i in range(len(venue_idx) - n, len(venue_idx)):
+            r = ftr[venue_idx[i]]
+            if r == 1:
+                form += 1
+            elif (r == 0 and is_home) or (r == 2 and not is_home):
+                form += 3
+    else:
+        start = max(len(all_idx) - n, 0)
+        form_games = len(all_idx) - start
+        for i in range(start, len(all_idx)):
+            r = ftr[all_idx[i]]
+            if r == 1:
+                form += 1
+            elif (r == 0 and home_id[all_idx[i]] == team_id) or (r == 2 and home_id[all_idx[i]] != team_id):
+                form += 3
+    
+    # Goals: last n venue games only (NaN scores are skipped, like Series.mean)
+    goals_sum = 0.0
+    goals_n = 0
+    conceded_sum = 0.0
+    conceded_n = 0
+    btts = 0
+    start = max(len(venue_idx) - n, 0)
+    for i in range(start, len(venue_idx)):
+        home_goals = fthg[venue_idx[i]]
+        away_goals = ftag[venue_idx[i]]
+        scored = home_goals if is_home else away_goals
+        conceded = away_goals if is_home else home_goals
+        if scored == scored:
+            goals_sum += scored
+            goals_n += 1
+        if conceded == conceded:
+            conceded_sum += conceded
+            conceded_n += 1
+        if home_goals > 0 and away_goals > 0:
+            btts += 1
+    goal_games = len(venue_idx) - start
+    
+    return form_games, form, goals_sum, goals_n, conceded_sum, conceded_n, btts, goal_games
+
+
+def _stats_from_kernel(totals: tuple, is_home: bool) -> dict:
+    """
+    Turn _stats_kernel totals into a stats dict with the usual defaults.
+    """
+    form_games, form, goals_sum, goals_n, conceded_sum, conceded_n, btts, goal_games = totals
+    if form_games == 0:
+        return dict(DEFAULT_STATS)
+    
+    if goal_games > 0:
+        avg_goals = goals_sum / goals_n if goals_n else float('nan')
+        avg_conceded = conceded_sum / conceded_n if conceded_n else float('nan')
+        btts_rate = (btts / goal_games) * 100
+    elif is_home:
+        avg_goals, avg_conceded, btts_rate = 1.3, 1.2, 50.0
+    else:
+        avg_goals, avg_conceded, btts_rate = 1.1, 1.4, 50.0
+    
+    return {
+        'form': int(form),
+        'avg_goals': avg_goals,
+        'avg_conceded': avg_conceded,
+        'btts_rate': btts_rate
+    }
+
+
+def get_team_stats(df: pd.DataFrame, team_name: str, is_home: bool, n_games: int = STATS_WINDOW) -> dict:
     """
     Get comprehensive stats for a team from their last N games.
+    Served from the precomputed tables when df is the one they were built from.
+    """
+    if df is not _stats_df or n_games != STATS_WINDOW:
+        return _compute_team_stats(df, team_name, is_home, n_games)
+    
+    stats = (HOME_STATS if is_home else AWAY_STATS).get(team_name, DEFAULT_STATS)
+    return dict(stats)
+
+
+def _compute_team_stats(df: pd.DataFrame, team_name: str, is_home: bool, n_games: int) -> dict:
+    """
+    Compute a team's stats by filtering df (uncached).
     """
     # Get venue-specific games
     if is_home:
@@ -87,24 +287,18 @@ def get_team_stats(df: pd.DataFrame, team_name: str, is_home: bool, n_games: int
             venue_games = df[(df['HomeTeam'] == team_name) | (df['AwayTeam'] == team_name)].tail(n_games)
     
     if len(venue_games) == 0:
-        return {
-            'form': 7,
-            'avg_goals': 1.3,
-            'avg_conceded': 1.2,
-            'btts_rate': 50.0
-        }
-    
-    # Calculate form
-    form = 0
-    for _, row in venue_games.iterrows():
-        is_home_game = row['HomeTeam'] == team_name
-        result = row['FTR']
-        if is_home_game:
-            if result == 'H': form += 3
-            elif result == 'D': form += 1
-        else:
-            if result == 'A': form += 3
-            elif result == 'D': form += 1
+        return dict(DEFAULT_STATS)
+    
+    # Calculate form (3 for a win, 1 for a draw) on the raw arrays
+    is_home_arr = venue_games['HomeTeam'].to_numpy() == team_name
+    ftr = venue_games['FTR'].to_numpy()
+    draw_points = np.where(ftr == 'D', 1, 0)
+    points = np.where(
+        is_home_arr,
+        np.where(ftr == 'H', 3, draw_points),
+        np.where(ftr == 'A', 3, draw_points)
+    )
+    form = int(points.sum())
     
     # Calculate venue-specific goals
     if is_home:
@@ -134,9 +328,9 @@ def get_team_stats(df: pd.DataFrame, team_name: str, is_home: bool, n_games: int
     }
 
 
-def prepare_features(home_stats: dict, away_stats: dict, feature_cols: list) -> pd.DataFrame:
+def prepare_features(home_stats: dict, away_stats: dict, feature_cols: list) -> np.ndarray:
     """
-    Prepare a single-row DataFrame with all required features.
+    Prepare a single-row float32 feature matrix, columns in feature_cols order.
     """
     features = {
         'HomeTeam_Form': home_stats['form'],
@@ -149,31 +343,52 @@ def prepare_features(home_stats: dict, away_stats: dict, feature_cols: list) ->
         'Away_BTTS_Rate': away_stats['btts_rate']
     }
     
-    return pd.DataFrame([features])[feature_cols]
+    return np.asarray([[features[col] for col in feature_cols]], dtype=np.float32)
 
 
 def predict_all_markets(home_team: str, away_team: str, check_squad: bool = True):
     """
     Run predictions on all 3 markets and find the best bet.
     Optionally checks squad news before predicting.
+    Results are cached for PREDICTION_TTL seconds; treat them as read-only.
+    A result whose squad check failed isn't cached, so the next call retries it.
+    """
+    key = (home_team, away_team, check_squad)
+    with _PRED_LOCK:
+        cached = _PRED_CACHE.get(key)
+    if cached is not None:
+        return cached
+    
+    result, squad_ok = _predict_all_markets(home_team, away_team, check_squad)
+    if squad_ok and 'error' not in result:
+        with _PRED_LOCK:
+            _PRED_CACHE[key] = result
+    return result
+
+
+def _predict_all_markets(home_team: str, away_team: str, check_squad: bool):
+    """
+    Uncached prediction behind predict_all_markets.
+    Returns (result, squad_ok); squad_ok is False if squad news couldn't be fetched.
     """
     # Load models
     models, config = load_models()
     if models is None:
-        return {'error': 'Models not loaded. Run train_glitch.py first.'}
+        return {'error': 'Models not loaded. Run train_glitch.py first.'}, False
     
     feature_cols = config['features']
     
     # Load data and get stats
     df = load_historical_data()
     if df is None:
-        return {'error': 'Historical data not found.'}
+        return {'error': 'Historical data not found.'}, False
     
     home_stats = get_team_stats(df, home_team, is_home=True)
     away_stats = get_team_stats(df, away_team, is_home=False)
     
     # Check squad intelligence (injuries/suspensions)
     squad_news = None
+    squad_ok = True
     if check_squad:
         try:
             from scout import get_team_news, get_team_id, format_squad_report
@@ -183,6 +398,7 @@ def predict_all_markets(home_team: str, away_team: str, check_squad: bool = True
             
             if home_id or away_id:
                 squad_news = get_team_news(home_team_id=home_id, away_team_id=away_id)
+                squad_ok = squad_news.get('complete', True)
                 
                 # Check if match should be skipped
                 if squad_news.get('should_skip'):
@@ -194,12 +410,13 @@ def predict_all_markets(home_team: str, away_team: str, check_squad: bool = True
                         'squad_news': squad_news,
                         'home_stats': home_stats,
                         'away_stats': away_stats
-                    }
+                    }, squad_ok
         except ImportError:
             # Scout module not available, proceed without squad check
             pass
         except Exception as e:
             print(f"Squad check failed: {e}")
+            squad_ok = False
     
     # Prepare features
     X = prepare_features(home_stats, away_stats, feature_cols)
@@ -209,7 +426,7 @@ def predict_all_markets(home_team: str, away_team: str, check_squad: bool = True
     
     # Model 1: Match Result
     win_proba = models['win'].predict_proba(X)[0]
-    win_pred = models['win'].predict(X)[0]
+    win_pred = int(win_proba.argmax())
     predictions['win'] = {
         'prediction': ['Home Win', 'Draw', 'Away Win'][win_pred],
         'probabilities': {
@@ -282,7 +499,7 @@ def predict_all_markets(home_team: str, away_team: str, check_squad: bool = True
     if squad_news:
         result['squad_news'] = squad_news
     
-    return result
+    return result, squad_ok
 
 
 def print_prediction(result: dict):
@@ -6,8 +6,15 @@ This makes predictions smarter by checking team news before betting.
 """
 
 import os
+import functools
+import threading
+import orjson
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from concurrent.futures import ThreadPoolExecutor
 from typing import Dict, Any, List, Optional
+from cachetools import TTLCache
 from dotenv import load_dotenv
 
 # Load environment
@@ -17,6 +24,27 @@ load_dotenv()
 API_HOST = "v3.football.api-sports.io"
 API_BASE = f"https://{API_HOST}"
 
+# Shared HTTP session: injuries/lineups/squad calls reuse pooled TLS connections,
+# and transient API errors (429/5xx) are retried with backoff
+_SESSION = requests.Session()
+_SESSION.mount("https://", HTTPAdapter(
+    pool_connections=4,
+    pool_maxsize=16,
+    max_retries=Retry(total=3, backoff_factor=0.3, status_forcelist=[429, 500, 502, 503, 504])
+))
+
+# API response caches so teams repeated across fixtures skip the API:
+# injury lists per (team_id, season) for 10 minutes, squads per team_id for an hour
+INJURY_TTL = 600
+SQUAD_TTL = 3600
+_INJURY_CACHE = TTLCache(maxsize=256, ttl=INJURY_TTL)
+_SQUAD_CACHE = TTLCache(maxsize=256, ttl=SQUAD_TTL)
+_CACHE_LOCK = threading.Lock()  # TTLCache isn't thread-safe
+
+# Worker threads for get_team_news' API requests, shared by all callers (the bot runs
+# up to 4 predictions at once, each fetching lineups and two injury lists)
+_FETCH_POOL = ThreadPoolExecutor(max_workers=12, thread_name_prefix='scout')
+
 
 def get_headers() -> Dict[str, str]:
     """Get API headers."""
@@ -29,7 +57,20 @@ def get_headers() -> Dict[str, str]:
 def get_injuries(team_id: int, season: int = 2025) -> List[Dict]:
     """
     Fetch injured/suspended players for a team.
+    Successful lookups are cached for INJURY_TTL seconds.
     """
+    injuries = _fetch_injuries(team_id, season)
+    return [] if injuries is None else injuries
+
+
+def _fetch_injuries(team_id: int, season: int = 2025) -> Optional[List[Dict]]:
+    """get_injuries, but None when the request failed."""
+    key = (team_id, season)
+    with _CACHE_LOCK:
+        cached = _INJURY_CACHE.get(key)
+    if cached is not None:
+        return list(cached)
+    
     url = f"{API_BASE}/injuries"
     params = {
         "team": team_id,
@@ -37,27 +78,32 @@ def get_injuries(team_id: int, season: int = 2025) -> List[Dict]:
     }
     
     try:
-        response = requests.get(url, headers=get_headers(), params=params, timeout=10)
+        response = _SESSION.get(url, headers=get_headers(), params=params, timeout=10)
         response.raise_for_status()
-        data = response.json()
+        injuries = _parse_injuries(orjson.loads(response.content))
         
-        injuries = []
-        for item in data.get('response', []):
-            player = item.get('player', {})
-            injury = item.get('fixture', {})
-            
-            injuries.append({
-                'player_name': player.get('name', 'Unknown'),
-                'player_id': player.get('id'),
-                'reason': player.get('reason', 'Unknown'),
-                'type': player.get('type', 'Unknown')  # Injury or Suspension
-            })
-        
-        return injuries
+        with _CACHE_LOCK:
+            _INJURY_CACHE[key] = injuries
+        return list(injuries)
     
-    except requests.RequestException as e:
+    except (requests.RequestException, orjson.JSONDecodeError) as e:
         print(f"Error fetching injuries: {e}")
-        return []
+        return None
+
+
+def _parse_injuries(data: Dict) -> List[Dict]:
+    """Injury list from an /injuries response."""
+    injuries = []
+    for item in data.get('response', []):
+        player = item.get('player') or {}
+        
+        injuries.append({
+            'player_name': player.get('name', 'Unknown'),
+            'player_id': player.get('id'),
+            'reason': player.get('reason', 'Unknown'),
+            'type': player.get('type', 'Unknown')  # Injury or Suspension
+        })
+    return injuries
 
 
 def get_lineups(fixture_id: int) -> Dict[str, Any]:
@@ -69,73 +115,146 @@ def get_lineups(fixture_id: int) -> Dict[str, Any]:
     params = {"fixture": fixture_id}
     
     try:
-        response = requests.get(url, headers=get_headers(), params=params, timeout=10)
+        response = _SESSION.get(url, headers=get_headers(), params=params, timeout=10)
         response.raise_for_status()
-        data = response.json()
-        
-        lineups = {
-            'home': None,
-            'away': None,
-            'available': False
-        }
-        
-        response_data = data.get('response', [])
-        
-        if len(response_data) >= 2:
-            lineups['available'] = True
-            lineups['home'] = {
-                'team': response_data[0].get('team', {}).get('name'),
-                'team_id': response_data[0].get('team', {}).get('id'),
-                'formation': response_data[0].get('formation'),
-                'starting_xi': [p.get('player', {}).get('name') for p in response_data[0].get('startXI', [])],
-                'coach': response_data[0].get('coach', {}).get('name')
-            }
-            lineups['away'] = {
-                'team': response_data[1].get('team', {}).get('name'),
-                'team_id': response_data[1].get('team', {}).get('id'),
-                'formation': response_data[1].get('formation'),
-                'starting_xi': [p.get('player', {}).get('name') for p in response_data[1].get('startXI', [])],
-                'coach': response_data[1].get('coach', {}).get('name')
-            }
-        
-        return lineups
+        return _parse_lineups(orjson.loads(response.content))
     
-    except requests.RequestException as e:
+    except (requests.RequestException, orjson.JSONDecodeError) as e:
         print(f"Error fetching lineups: {e}")
-        return {'home': None, 'away': None, 'available': False}
+        return {'home': None, 'away': None, 'available': False, 'failed': True}
+
+
+def _parse_lineups(data: Dict) -> Dict[str, Any]:
+    """Home/away lineups from a /fixtures/lineups response."""
+    lineups = {
+        'home': None,
+        'away': None,
+        'available': False
+    }
+    
+    response_data = data.get('response', [])
+    
+    if len(response_data) >= 2:
+        lineups['available'] = True
+        lineups['home'] = _parse_lineup(response_data[0])
+        lineups['away'] = _parse_lineup(response_data[1])
+    
+    return lineups
+
+
+def _parse_lineup(entry: Dict) -> Dict[str, Any]:
+    """One team's lineup entry (no throwaway {} defaults per player)."""
+    team = entry.get('team') or {}
+    coach = entry.get('coach') or {}
+    return {
+        'team': team.get('name'),
+        'team_id': team.get('id'),
+        'formation': entry.get('formation'),
+        'starting_xi': [
+            player.get('name') if (player := p.get('player')) else None
+            for p in entry.get('startXI') or []
+        ],
+        'coach': coach.get('name')
+    }
 
 
 def get_squad(team_id: int, season: int = 2025) -> List[Dict]:
     """
     Fetch full squad with player importance markers.
+    Successful lookups are cached for SQUAD_TTL seconds.
     """
+    with _CACHE_LOCK:
+        cached = _SQUAD_CACHE.get(team_id)
+    if cached is not None:
+        return list(cached)
+    
     url = f"{API_BASE}/players/squads"
     params = {"team": team_id}
     
     try:
-        response = requests.get(url, headers=get_headers(), params=params, timeout=10)
+        response = _SESSION.get(url, headers=get_headers(), params=params, timeout=10)
         response.raise_for_status()
-        data = response.json()
-        
-        players = []
-        response_data = data.get('response', [])
+        players = _parse_squad(orjson.loads(response.content))
         
-        if response_data:
-            for player in response_data[0].get('players', []):
-                players.append({
-                    'id': player.get('id'),
-                    'name': player.get('name'),
-                    'position': player.get('position'),
-                    'number': player.get('number')
-                })
-        
-        return players
+        with _CACHE_LOCK:
+            _SQUAD_CACHE[team_id] = players
+        return list(players)
     
-    except requests.RequestException as e:
+    except (requests.RequestException, orjson.JSONDecodeError) as e:
         print(f"Error fetching squad: {e}")
         return []
 
 
+def _parse_squad(data: Dict) -> List[Dict]:
+    """Player list from a /players/squads response."""
+    players = []
+    response_data = data.get('response', [])
+    
+    if response_data:
+        for player in response_data[0].get('players', []):
+            players.append({
+                'id': player.get('id'),
+                'name': player.get('name'),
+                'position': player.get('position'),
+                'number': player.get('number')
+            })
+    return players
+
+
+# Key players by team (top scorers, captains - hardcoded for EPL top teams)
+KEY_PLAYERS = {
+    # Arsenal
+    42: ['Saka', 'Saliba', 'Odegaard', 'Rice', 'Havertz'],
+    # Chelsea
+    49: ['Palmer', 'Jackson', 'Caicedo', 'Reece James'],
+    # Man City
+    50: ['Haaland', 'De Bruyne', 'Rodri', 'Dias'],
+    # Liverpool
+    40: ['Salah', 'Van Dijk', 'Alexander-Arnold', 'Mac Allister'],
+    # Man United
+    33: ['Fernandes', 'Rashford', 'Casemiro', 'Martinez'],
+    # Tottenham
+    47: ['Son', 'Maddison', 'Romero', 'Van de Ven']
+}
+
+
+def _normalize_name(name: str) -> str:
+    """Lowercase with single spaces between words."""
+    return ' '.join(name.lower().split())
+
+
+def _build_name_trie(names: List[str]) -> Dict:
+    """Character trie (nested dicts) of normalized names; a None key marks a name's end."""
+    root = {}
+    for name in names:
+        node = root
+        for ch in _normalize_name(name):
+            node = node.setdefault(ch, {})
+        node[None] = True
+    return root
+
+
+# One trie per team of its key players' names, so checking an injured player
+# costs O(len(name)) however many key players a team has
+_KEY_PLAYER_TRIE = {team_id: _build_name_trie(names) for team_id, names in KEY_PLAYERS.items()}
+
+
+def _is_key_player(trie: Dict, player_name: str) -> bool:
+    """True if a key player's name appears in player_name, starting at a word start."""
+    name = _normalize_name(player_name)
+    for start in range(len(name)):
+        if start and name[start - 1] != ' ':
+            continue
+        node = trie
+        for i in range(start, len(name)):
+            node = node.get(name[i])
+            if node is None:
+                break
+            if None in node:
+                return True
+    return False
+
+
 def calculate_squad_strength(team_id: int, injuries: List[Dict], key_players: List[str] = None) -> Dict[str, Any]:
     """
     Calculate Squad Strength Score (0-100).
@@ -156,29 +275,13 @@ def calculate_squad_strength(team_id: int, injuries: List[Dict], key_players: Li
     key_positions = ['Attacker', 'Midfielder']
     critical_positions = ['Goalkeeper', 'Defender']
     
-    # Key players by team (top scorers, captains - hardcoded for EPL top teams)
-    key_players_db = {
-        # Arsenal
-        42: ['Saka', 'Saliba', 'Odegaard', 'Rice', 'Havertz'],
-        # Chelsea
-        49: ['Palmer', 'Jackson', 'Caicedo', 'Reece James'],
-        # Man City
-        50: ['Haaland', 'De Bruyne', 'Rodri', 'Dias'],
-        # Liverpool
-        40: ['Salah', 'Van Dijk', 'Alexander-Arnold', 'Mac Allister'],
-        # Man United
-        33: ['Fernandes', 'Rashford', 'Casemiro', 'Martinez'],
-        # Tottenham
-        47: ['Son', 'Maddison', 'Romero', 'Van de Ven']
-    }
-    
-    team_key_players = key_players_db.get(team_id, [])
+    key_player_trie = _KEY_PLAYER_TRIE.get(team_id)
     
     for injury in injuries:
         player_name = injury.get('player_name', '')
         
         # Check if key player
-        is_key = any(kp.lower() in player_name.lower() for kp in team_key_players)
+        is_key = bool(key_player_trie and _is_key_player(key_player_trie, player_name))
         
         if is_key:
             score -= 15
@@ -210,51 +313,82 @@ def get_team_news(fixture_id: int = None, home_team_id: int = None, away_team_id
     Returns:
         Dictionary with squad strength for both teams and recommendation.
     """
-    result = {
-        'home': {'score': 100, 'status': 'UNKNOWN', 'injuries': []},
-        'away': {'score': 100, 'status': 'UNKNOWN', 'injuries': []},
-        'lineups_available': False,
-        'should_skip': False,
-        'skip_reason': None
-    }
+    result = _new_team_news()
+    
+    # Lineups and both injury lists are independent requests, so run them in parallel.
+    # A team id that only comes from the lineups is fetched once those arrive.
+    lineups_future = _FETCH_POOL.submit(get_lineups, fixture_id) if fixture_id else None
+    home_future = _FETCH_POOL.submit(_fetch_injuries, home_team_id) if home_team_id else None
+    away_future = _FETCH_POOL.submit(_fetch_injuries, away_team_id) if away_team_id else None
     
     # Check lineups if fixture_id provided
-    if fixture_id:
-        lineups = get_lineups(fixture_id)
-        result['lineups_available'] = lineups.get('available', False)
-        if lineups.get('home'):
-            result['home']['lineup'] = lineups['home']
-            home_team_id = home_team_id or lineups['home'].get('team_id')
-        if lineups.get('away'):
-            result['away']['lineup'] = lineups['away']
-            away_team_id = away_team_id or lineups['away'].get('team_id')
+    if lineups_future:
+        home_team_id, away_team_id = _apply_lineups(
+            result, lineups_future.result(), home_team_id, away_team_id
+        )
+        if home_future is None and home_team_id:
+            home_future = _FETCH_POOL.submit(_fetch_injuries, home_team_id)
+        if away_future is None and away_team_id:
+            away_future = _FETCH_POOL.submit(_fetch_injuries, away_team_id)
     
     # Check injuries for home team
-    if home_team_id:
-        home_injuries = get_injuries(home_team_id)
-        home_strength = calculate_squad_strength(home_team_id, home_injuries)
-        result['home']['score'] = home_strength['score']
-        result['home']['status'] = home_strength['status']
-        result['home']['injuries'] = home_strength['reasons']
-        result['home']['injuries_count'] = home_strength['injuries_count']
+    if home_future:
+        _apply_strength(result, 'home', home_team_id, home_future.result())
     
     # Check injuries for away team
-    if away_team_id:
-        away_injuries = get_injuries(away_team_id)
-        away_strength = calculate_squad_strength(away_team_id, away_injuries)
-        result['away']['score'] = away_strength['score']
-        result['away']['status'] = away_strength['status']
-        result['away']['injuries'] = away_strength['reasons']
-        result['away']['injuries_count'] = away_strength['injuries_count']
-    
-    # Determine if match should be skipped
+    if away_future:
+        _apply_strength(result, 'away', away_team_id, away_future.result())
+    
+    _apply_skip(result)
+    return result
+
+
+def _new_team_news() -> Dict[str, Any]:
+    """Empty team news result (full strength, nothing known yet)."""
+    return {
+        'home': {'score': 100, 'status': 'UNKNOWN', 'injuries': []},
+        'away': {'score': 100, 'status': 'UNKNOWN', 'injuries': []},
+        'lineups_available': False,
+        'should_skip': False,
+        'skip_reason': None,
+        'complete': True  # False if any API request failed
+    }
+
+
+def _apply_lineups(result: Dict[str, Any], lineups: Dict[str, Any], home_team_id: Optional[int], away_team_id: Optional[int]):
+    """Store lineups in the result; returns team ids, filled in from the lineups where missing."""
+    result['lineups_available'] = lineups.get('available', False)
+    if lineups.get('failed'):
+        result['complete'] = False
+    if lineups.get('home'):
+        result['home']['lineup'] = lineups['home']
+        home_team_id = home_team_id or lineups['home'].get('team_id')
+    if lineups.get('away'):
+        result['away']['lineup'] = lineups['away']
+        away_team_id = away_team_id or lineups['away'].get('team_id')
+    return home_team_id, away_team_id
+
+
+def _apply_strength(result: Dict[str, Any], side_key: str, team_id: int, injuries: Optional[List[Dict]]) -> None:
+    """Store one team's squad strength in its side of the result (injuries is None if the fetch failed)."""
+    if injuries is None:
+        result['complete'] = False
+        injuries = []
+    side = result[side_key]
+    strength = calculate_squad_strength(team_id, injuries)
+    side['score'] = strength['score']
+    side['status'] = strength['status']
+    side['injuries'] = strength['reasons']
+    side['injuries_count'] = strength['injuries_count']
+
+
+def _apply_skip(result: Dict[str, Any]) -> None:
+    """Determine if match should be skipped."""
     min_score = min(result['home']['score'], result['away']['score'])
     if min_score < 70:
         result['should_skip'] = True
         weak_team = 'Home' if result['home']['score'] < result['away']['score'] else 'Away'
         result['skip_reason'] = f"{weak_team} team has too many key players missing (Squad Score: {min_score}%)"
-    
-    return result
 
 
 def format_squad_report(news: Dict[str, Any], home_name: str = "Home", away_name: str = "Away") -> str:
@@ -336,18 +470,33 @@ TEAM_IDS = {
 }
 
 
+# Lowercased names for partial matching, plus common nicknames no partial match catches
+_TEAM_IDS_LOWER = [(name.lower(), tid) for name, tid in TEAM_IDS.items()]
+TEAM_ALIASES = {
+    'spurs': 47,
+    'man utd': 33,
+    'wolverhampton': 39,
+    'wolverhampton wanderers': 39,
+}
+
+
 def get_team_id(team_name: str) -> Optional[int]:
     """Get team ID from team name."""
     # Direct match
     if team_name in TEAM_IDS:
         return TEAM_IDS[team_name]
     
-    # Partial match
-    for name, tid in TEAM_IDS.items():
-        if team_name.lower() in name.lower() or name.lower() in team_name.lower():
+    return _match_team_id(team_name.lower())
+
+
+@functools.lru_cache(maxsize=512)
+def _match_team_id(name_lc: str) -> Optional[int]:
+    """Partial/alias match on a lowercased name (cached, names repeat across fixtures)."""
+    for name, tid in _TEAM_IDS_LOWER:
+        if name_lc in name or name in name_lc:
             return tid
     
-    return None
+    return TEAM_ALIASES.get(name_lc)
 
 
 if __name__ == "__main__":
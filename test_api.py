@@ -5,6 +5,7 @@ Run: python test_api.py
 """
 
 import os
+import orjson
 import requests
 from dotenv import load_dotenv
 
@@ -58,7 +59,7 @@ def test_connection():
             print("📊 API Response:")
             print("─" * 50)
             
-            data = response.json()
+            data = orjson.loads(response.content)
             
             # Pretty print important info
             if 'response' in data:
@@ -83,8 +84,8 @@ def test_connection():
                 print(f"   Remaining: {remaining}")
             else:
                 # Print raw response
-                import json
-                print(json.dumps(data, indent=2))
+                from pprint import pprint
+                pprint(data, width=120, compact=True)
             
             print()
             print("=" * 50)
@@ -103,7 +104,7 @@ def test_connection():
         print("   Error: Request timed out (10 seconds)")
         return False
     
-    except requests.RequestException as e:
+    except (requests.RequestException, orjson.JSONDecodeError) as e:
         print("❌ CONNECTION FAILED!")
         print(f"   Error: {e}")
         return False
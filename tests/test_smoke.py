@@ -39,3 +39,132 @@ def test_mock_fixture_generation():
     fixtures = data_manager.get_mock_fixtures(39)
     assert len(fixtures) > 0
     assert "home_team" in fixtures[0]
+
+def test_fixture_cache_roundtrip(tmp_path, monkeypatch):
+    """Test that cached fixtures survive a save/load cycle."""
+    monkeypatch.setattr(data_manager, "CACHE_DIR", str(tmp_path / "cache"))
+    fixtures = data_manager.get_mock_fixtures(39)
+    
+    data_manager.update_fixture_cache(39, fixtures)
+    assert data_manager.get_cached_fixtures(39) == fixtures
+    assert data_manager.get_cached_fixtures(140) is None
+
+def test_shorten_team_name():
+    """Test button label shortening, including names with a suffix."""
+    import main
+    assert main.shorten_team_name("Manchester United") == "Man Utd"
+    assert main.shorten_team_name("Manchester City W") == "Man City W"
+    assert main.shorten_team_name("Arsenal") == "Arsenal"
+
+def test_mock_fixture_page_not_cached(tmp_path, monkeypatch):
+    """Test that a league page built from the mock fallback isn't cached, but a real one is."""
+    import asyncio
+    from unittest.mock import AsyncMock
+    import main
+    monkeypatch.setattr(data_manager, "CACHE_DIR", str(tmp_path / "cache"))
+    monkeypatch.setattr(main, "_LEAGUE_PAGE_CACHE", {})
+    query = MagicMock()
+    query.edit_message_text = AsyncMock()
+    
+    monkeypatch.setattr(data_manager, "_fetch_fixtures_from_api", lambda league_id, count: None)
+    asyncio.run(main.show_fixtures(query, 39))
+    assert 39 not in main._LEAGUE_PAGE_CACHE
+    
+    live = [{'fixture_id': 1, 'datetime': '2025-08-16T14:00:00+00:00', 'home_team': 'Arsenal', 'away_team': 'Chelsea'}]
+    monkeypatch.setattr(data_manager, "_fetch_fixtures_from_api", lambda league_id, count: live)
+    asyncio.run(main.show_fixtures(query, 39))
+    assert 39 in main._LEAGUE_PAGE_CACHE
+
+def test_team_callback_tokens(monkeypatch):
+    """Test fixture button tokens: history names as ids, others as cleaned letters."""
+    import main
+    import predict_glitch
+    monkeypatch.setattr(predict_glitch, "TEAM_NAMES", ["Arsenal", "Chelsea", "Man United"])
+    
+    token = main.team_callback_token("Man United")
+    assert token == "2"
+    assert main.resolve_team_token(token) == "Man United"
+    
+    assert main.team_callback_token("Nott'm Forest FC") == "NottmForestF"
+    assert main.resolve_team_token("NottmForestF") == "NottmForestF"
+    
+    assert main.resolve_team_token("3") is None
+
+def test_failed_squad_check_not_cached(monkeypatch):
+    """Test that predictions are only cached when the squad check didn't fail."""
+    import scout
+    import predict_glitch
+    if not os.path.exists("model_win.pkl"):
+        pytest.skip("Models not found, skipping prediction cache test")
+    monkeypatch.setattr(predict_glitch, "_PRED_CACHE", {})
+    monkeypatch.setattr(scout, "_fetch_injuries", lambda team_id, season=2025: None)
+    
+    result = predict_glitch.predict_all_markets("Arsenal", "Chelsea")
+    assert result['squad_news']['complete'] is False
+    assert not predict_glitch._PRED_CACHE
+    
+    result = predict_glitch.predict_all_markets("Arsenal", "Chelsea", check_squad=False)
+    assert predict_glitch._PRED_CACHE[("Arsenal", "Chelsea", False)] is result
+
+def test_stale_fixtures_served_while_refreshing(tmp_path, monkeypatch):
+    """Test that an expired (but not too old) entry is returned and refreshed in the background."""
+    import threading
+    import time
+    monkeypatch.setattr(data_manager, "CACHE_DIR", str(tmp_path / "cache"))
+    fixtures = data_manager.get_mock_fixtures(39)
+    data_manager.save_cache_entry("fixtures_39", {
+        'timestamp': time.time() - data_manager.CACHE_DURATION - 60,
+        'ttl': data_manager.CACHE_DURATION,
+        'data': fixtures
+    })
+    refreshed = threading.Event()
+    monkeypatch.setattr(data_manager, "_fetch_fixtures_from_api", lambda league_id, count: refreshed.set())
+    
+    assert data_manager.get_cached_fixtures(39) == fixtures
+    assert refreshed.wait(5)
+
+def test_fixture_cache_write_debounced(tmp_path, monkeypatch):
+    """Test that an entry written under MIN_REFRESH_INTERVAL ago isn't rewritten."""
+    monkeypatch.setattr(data_manager, "CACHE_DIR", str(tmp_path / "cache"))
+    first = data_manager.get_mock_fixtures(39)
+    
+    data_manager.update_fixture_cache(39, first)
+    data_manager.update_fixture_cache(39, first[:1])
+    assert data_manager.get_cached_fixtures(39) == first
+
+def test_concurrent_fixture_misses_fetch_once(tmp_path, monkeypatch):
+    """Test that concurrent cache misses for one league make a single API call."""
+    import threading
+    import time
+    monkeypatch.setattr(data_manager, "CACHE_DIR", str(tmp_path / "cache"))
+    fixtures = data_manager.get_mock_fixtures(140)
+    calls = []
+    
+    def fake_fetch(league_id, count):
+        calls.append(league_id)
+        time.sleep(0.2)  # Hold the league lock while the other callers arrive
+        data_manager.update_fixture_cache(league_id, fixtures)
+        return fixtures
+    
+    monkeypatch.setattr(data_manager, "_fetch_fixtures_from_api", fake_fetch)
+    results = []
+    threads = [
+        threading.Thread(target=lambda: results.append(data_manager.fetch_fixtures_with_cache(140)))
+        for _ in range(5)
+    ]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    
+    assert calls == [140]
+    assert results == [fixtures] * 5
+
+def test_key_player_matches_word_starts():
+    """Test key player matching: names must start at a word start, multi-word names work."""
+    import scout
+    spurs = scout._KEY_PLAYER_TRIE[47]
+    assert scout._is_key_player(spurs, "Heung-Min Son")
+    assert not scout._is_key_player(spurs, "Mason Mount")
+    assert not scout._is_key_player(spurs, "Nicolas Jackson")
+    assert scout._is_key_player(scout._KEY_PLAYER_TRIE[40], "Alexis  Mac Allister")
@@ -7,13 +7,47 @@ Trains 3 separate models for:
 3. Both Teams to Score (BTTS)
 """
 
+import os
 import pandas as pd
 import numpy as np
 import json
 import pickle
-from sklearn.ensemble import RandomForestClassifier
+import joblib
+from sklearn.ensemble import HistGradientBoostingClassifier
 from sklearn.metrics import accuracy_score, classification_report
-from collections import defaultdict
+from threadpoolctl import threadpool_limits
+from collections import defaultdict, deque
+from concurrent.futures import ProcessPoolExecutor
+from numba_shim import njit  # Plain Python when numba isn't installed
+
+# master_data.csv columns training uses, with types fixed up front
+TRAIN_COLUMNS = ['Date', 'HomeTeam', 'AwayTeam', 'FTHG', 'FTAG', 'FTR']
+TRAIN_DTYPES = {'HomeTeam': 'category', 'AwayTeam': 'category', 'FTR': 'category'}
+
+# Rolling feature columns, in the row order _rolling_kernel returns them
+ROLLING_COLS = [
+    'HomeTeam_Form', 'AwayTeam_Form',
+    'Home_Avg_Goals', 'Away_Avg_Goals',
+    'Home_Avg_Conceded', 'Away_Avg_Conceded',
+    'Home_BTTS_Rate', 'Away_BTTS_Rate'
+]
+
+
+def load_training_data(path: str = 'master_data.csv') -> pd.DataFrame:
+    """
+    Read just the columns training needs: teams/result as categories, Date parsed.
+    Uses pandas' pyarrow CSV engine when pyarrow is installed.
+    """
+    kwargs = {
+        'usecols': TRAIN_COLUMNS,
+        'dtype': TRAIN_DTYPES,
+        'parse_dates': ['Date'],
+        'date_format': '%d/%m/%Y'
+    }
+    try:
+        return pd.read_csv(path, engine='pyarrow', **kwargs)
+    except ImportError:
+        return pd.read_csv(path, **kwargs)
 
 
 def calculate_rolling_stats(df: pd.DataFrame, n_games: int = 5) -> pd.DataFrame:
@@ -30,77 +64,201 @@ def calculate_rolling_stats(df: pd.DataFrame, n_games: int = 5) -> pd.DataFrame:
     
     # Sort by date
     df = df.copy()
-    df['Date'] = pd.to_datetime(df['Date'], format='%d/%m/%Y', errors='coerce')
+    if not pd.api.types.is_datetime64_any_dtype(df['Date']):
+        df['Date'] = pd.to_datetime(df['Date'], format='%d/%m/%Y', errors='coerce')
     df = df.sort_values('Date').reset_index(drop=True)
     
-    # Tracking dictionaries
-    team_results = defaultdict(list)       # Form points
-    home_goals = defaultdict(list)          # Goals at home
-    home_conceded = defaultdict(list)       # Conceded at home
-    away_goals = defaultdict(list)          # Goals away
-    away_conceded = defaultdict(list)       # Conceded away
-    home_btts = defaultdict(list)           # BTTS at home (0 or 1)
-    away_btts = defaultdict(list)           # BTTS away (0 or 1)
-    
-    # Initialize columns
-    new_cols = [
-        'HomeTeam_Form', 'AwayTeam_Form',
-        'Home_Avg_Goals', 'Away_Avg_Goals',
-        'Home_Avg_Conceded', 'Away_Avg_Conceded',
-        'Home_BTTS_Rate', 'Away_BTTS_Rate'
-    ]
-    for col in new_cols:
-        df[col] = np.nan
-    
-    for idx, row in df.iterrows():
-        home_team = row['HomeTeam']
-        away_team = row['AwayTeam']
+    fthg = df['FTHG'].to_numpy(dtype=np.float64)
+    ftag = df['FTAG'].to_numpy(dtype=np.float64)
+    if not (np.isnan(fthg).any() or np.isnan(ftag).any()):
+        # Single pass over integer-coded arrays (compiled when Numba is installed)
+        n_rows = len(df)
+        codes, teams = pd.factorize(
+            np.concatenate([df['HomeTeam'].to_numpy(), df['AwayTeam'].to_numpy()]),
+            use_na_sentinel=False
+        )
+        ftr = np.select([df['FTR'] == 'H', df['FTR'] == 'D'], [0, 1], default=2).astype(np.int8)
+        out = _rolling_kernel(
+            codes[:n_rows], codes[n_rows:], fthg.astype(np.int64), ftag.astype(np.int64),
+            ftr, len(teams), n_games
+        )
+    else:
+        out = _rolling_stats_python(df, n_games)
+    
+    # All eight columns assigned once, as float32 (plenty of precision for the models)
+    for col, values in zip(ROLLING_COLS, out):
+        df[col] = values.astype(np.float32)
+    return df
+
+
+@njit(cache=True)
+def _rolling_kernel(home_ix, away_ix, fthg, ftag, ftr, n_teams, n):
+    """
+    Rolling stats from each team's previous n games, one row at a time.
+    Per-team ring buffers keep running sums, so each row is O(1).
+    Returns an (8, rows) float array in ROLLING_COLS order (NaN until n games).
+    """
+    n_rows = len(home_ix)
+    out = np.full((8, n_rows), np.nan)
+    
+    # Form points over all games
+    form_buf = np.zeros((n_teams, n), np.int64)
+    form_sum = np.zeros(n_teams, np.int64)
+    form_cnt = np.zeros(n_teams, np.int64)
+    # Venue stats: [home/away venue, goals/conceded/btts, team, slot]
+    venue_buf = np.zeros((2, 3, n_teams, n), np.int64)
+    venue_sum = np.zeros((2, 3, n_teams), np.int64)
+    venue_cnt = np.zeros((2, n_teams), np.int64)
+    values = np.zeros((2, 3), np.int64)  # This match's [venue, stat] values
+    
+    for i in range(n_rows):
+        h = home_ix[i]
+        a = away_ix[i]
         
         # Calculate current stats BEFORE this match
-        if len(team_results[home_team]) >= n_games:
-            df.at[idx, 'HomeTeam_Form'] = sum(team_results[home_team][-n_games:])
+        if form_cnt[h] >= n:
+            out[0, i] = form_sum[h]
+        if form_cnt[a] >= n:
+            out[1, i] = form_sum[a]
+        if venue_cnt[0, h] >= n:
+            out[2, i] = venue_sum[0, 0, h] / n
+            out[4, i] = venue_sum[0, 1, h] / n
+            out[6, i] = (venue_sum[0, 2, h] / n) * 100
+        if venue_cnt[1, a] >= n:
+            out[3, i] = venue_sum[1, 0, a] / n
+            out[5, i] = venue_sum[1, 1, a] / n
+            out[7, i] = (venue_sum[1, 2, a] / n) * 100
         
-        if len(team_results[away_team]) >= n_games:
-            df.at[idx, 'AwayTeam_Form'] = sum(team_results[away_team][-n_games:])
+        # NOW update tracking with this match's results
+        if ftr[i] == 0:
+            home_points, away_points = 3, 0
+        elif ftr[i] == 1:
+            home_points, away_points = 1, 1
+        else:
+            home_points, away_points = 0, 3
+        btts = 1 if (fthg[i] > 0 and ftag[i] > 0) else 0
+        values[0, 0], values[0, 1], values[0, 2] = fthg[i], ftag[i], btts
+        values[1, 0], values[1, 1], values[1, 2] = ftag[i], fthg[i], btts
         
-        if len(home_goals[home_team]) >= n_games:
-            df.at[idx, 'Home_Avg_Goals'] = np.mean(home_goals[home_team][-n_games:])
-            df.at[idx, 'Home_Avg_Conceded'] = np.mean(home_conceded[home_team][-n_games:])
-            df.at[idx, 'Home_BTTS_Rate'] = np.mean(home_btts[home_team][-n_games:]) * 100
+        for side in range(2):
+            team = h if side == 0 else a
+            points = home_points if side == 0 else away_points
+            
+            slot = form_cnt[team] % n
+            form_sum[team] += points - form_buf[team, slot]
+            form_buf[team, slot] = points
+            form_cnt[team] += 1
+            
+            slot = venue_cnt[side, team] % n
+            for stat in range(3):
+                venue_sum[side, stat, team] += values[side, stat] - venue_buf[side, stat, team, slot]
+                venue_buf[side, stat, team, slot] = values[side, stat]
+            venue_cnt[side, team] += 1
+    
+    return out
+
+
+class _RollingWindow:
+    """
+    A team's last n values with a running sum, so each update is O(1).
+    NaN values are counted separately: while one is in the window, sum() is NaN (like np.mean).
+    """
+    __slots__ = ('values', 'total', 'nans')
+    
+    def __init__(self, n: int):
+        self.values = deque(maxlen=n)
+        self.total = 0
+        self.nans = 0
+    
+    def push(self, value) -> None:
+        if len(self.values) == self.values.maxlen:
+            oldest = self.values[0]
+            if oldest != oldest:
+                self.nans -= 1
+            else:
+                self.total -= oldest
+        if value != value:
+            self.nans += 1
+        else:
+            self.total += value
+        self.values.append(value)
+    
+    def full(self) -> bool:
+        return len(self.values) == self.values.maxlen
+    
+    def sum(self):
+        return float('nan') if self.nans else self.total
+    
+    def mean(self) -> float:
+        return self.sum() / len(self.values)
+
+
+def _rolling_stats_python(df: pd.DataFrame, n_games: int) -> np.ndarray:
+    """
+    Row-by-row rolling stats, used when some scores are missing (NaN).
+    Returns an (8, rows) array in ROLLING_COLS order, like _rolling_kernel.
+    """
+    # Tracking dictionaries: each team's last n_games values with a running sum
+    def new_window():
+        return _RollingWindow(n_games)
+    
+    team_results = defaultdict(new_window)       # Form points
+    home_goals = defaultdict(new_window)          # Goals at home
+    home_conceded = defaultdict(new_window)       # Conceded at home
+    away_goals = defaultdict(new_window)          # Goals away
+    away_conceded = defaultdict(new_window)       # Conceded away
+    home_btts = defaultdict(new_window)           # BTTS at home (0 or 1)
+    away_btts = defaultdict(new_window)           # BTTS away (0 or 1)
+    
+    # Output buffers, filled by plain array indexing
+    out = np.full((len(ROLLING_COLS), len(df)), np.nan, dtype=np.float32)
+    home_form, away_form, home_avg_goals, away_avg_goals, \
+        home_avg_conceded, away_avg_conceded, home_btts_rate, away_btts_rate = out
+    
+    rows = zip(df['HomeTeam'], df['AwayTeam'], df['FTR'], df['FTHG'], df['FTAG'])
+    for idx, (home_team, away_team, ftr, fthg, ftag) in enumerate(rows):
+        # Calculate current stats BEFORE this match
+        if team_results[home_team].full():
+            home_form[idx] = team_results[home_team].sum()
         
-        if len(away_goals[away_team]) >= n_games:
-            df.at[idx, 'Away_Avg_Goals'] = np.mean(away_goals[away_team][-n_games:])
-            df.at[idx, 'Away_Avg_Conceded'] = np.mean(away_conceded[away_team][-n_games:])
-            df.at[idx, 'Away_BTTS_Rate'] = np.mean(away_btts[away_team][-n_games:]) * 100
+        if team_results[away_team].full():
+            away_form[idx] = team_results[away_team].sum()
         
-        # NOW update tracking with this match's results
-        ftr = row['FTR']
-        fthg = row['FTHG']
-        ftag = row['FTAG']
+        if home_goals[home_team].full():
+            home_avg_goals[idx] = home_goals[home_team].mean()
+            home_avg_conceded[idx] = home_conceded[home_team].mean()
+            home_btts_rate[idx] = home_btts[home_team].mean() * 100
+        
+        if away_goals[away_team].full():
+            away_avg_goals[idx] = away_goals[away_team].mean()
+            away_avg_conceded[idx] = away_conceded[away_team].mean()
+            away_btts_rate[idx] = away_btts[away_team].mean() * 100
         
+        # NOW update tracking with this match's results
+
         # Form points
         if ftr == 'H':
-            team_results[home_team].append(3)
-            team_results[away_team].append(0)
+            team_results[home_team].push(3)
+            team_results[away_team].push(0)
         elif ftr == 'D':
-            team_results[home_team].append(1)
-            team_results[away_team].append(1)
+            team_results[home_team].push(1)
+            team_results[away_team].push(1)
         else:
-            team_results[home_team].append(0)
-            team_results[away_team].append(3)
+            team_results[home_team].push(0)
+            team_results[away_team].push(3)
         
         # Goals tracking
-        home_goals[home_team].append(fthg)
-        home_conceded[home_team].append(ftag)
-        away_goals[away_team].append(ftag)
-        away_conceded[away_team].append(fthg)
+        home_goals[home_team].push(fthg)
+        home_conceded[home_team].push(ftag)
+        away_goals[away_team].push(ftag)
+        away_conceded[away_team].push(fthg)
         
         # BTTS tracking
         btts_occurred = 1 if (fthg > 0 and ftag > 0) else 0
-        home_btts[home_team].append(btts_occurred)
-        away_btts[away_team].append(btts_occurred)
+        home_btts[home_team].push(btts_occurred)
+        away_btts[away_team].push(btts_occurred)
     
-    return df
+    return out
 
 
 def create_targets(df: pd.DataFrame) -> pd.DataFrame:
@@ -111,14 +269,19 @@ def create_targets(df: pd.DataFrame) -> pd.DataFrame:
     
     df = df.copy()
     
-    # Target 1: Match Result (0=Home, 1=Draw, 2=Away)
-    df['Target_Win'] = df['FTR'].map({'H': 0, 'D': 1, 'A': 2})
+    # Target 1: Match Result (0=Home, 1=Draw, 2=Away); unknown results stay NaN
+    win = pd.Categorical(df['FTR'], categories=['H', 'D', 'A']).codes
+    df['Target_Win'] = win if (win >= 0).all() else np.where(win >= 0, win, np.nan)
+    
+    # Goals as plain arrays, shared by both goal-based targets
+    fthg = df['FTHG'].to_numpy()
+    ftag = df['FTAG'].to_numpy()
     
     # Target 2: Over 2.5 Goals (1 if total > 2.5, else 0)
-    df['Target_Goals'] = ((df['FTHG'] + df['FTAG']) > 2.5).astype(int)
+    df['Target_Goals'] = ((fthg + ftag) > 2.5).view(np.int8)
     
     # Target 3: BTTS (1 if both teams scored, else 0)
-    df['Target_BTTS'] = ((df['FTHG'] > 0) & (df['FTAG'] > 0)).astype(int)
+    df['Target_BTTS'] = ((fthg > 0) & (ftag > 0)).view(np.int8)
     
     print(f"   Target_Win distribution:   {df['Target_Win'].value_counts().to_dict()}")
     print(f"   Target_Goals (Over 2.5):   {df['Target_Goals'].value_counts().to_dict()}")
@@ -127,44 +290,45 @@ def create_targets(df: pd.DataFrame) -> pd.DataFrame:
     return df
 
 
-def prepare_data(df: pd.DataFrame, feature_cols: list, target_col: str):
+def prepare_data_all(df: pd.DataFrame, feature_cols: list, target_cols: list):
     """
-    Prepare features and target for training.
+    Prepare features once for all markets.
+    Returns X (float32) and Y with one int8 column per target, -1 where a target is unknown.
     """
-    df_clean = df.dropna(subset=feature_cols + [target_col])
-    X = df_clean[feature_cols]
-    y = df_clean[target_col]
-    return X, y, df_clean
+    df_clean = df.dropna(subset=feature_cols)
+    X = df_clean[feature_cols].astype(np.float32)
+    Y = df_clean[target_cols].fillna(-1).astype(np.int8)
+    return X, Y
 
 
-def train_single_model(X, y, model_name: str, test_size: float = 0.2):
+def train_single_model(X, y, test_size: float = 0.2, n_jobs: int = -1):
     """
-    Train a single Random Forest model with time-based split.
+    Train a single gradient-boosted tree model with time-based split.
+    Features are binned into 8-bit histograms once, so fitting and predicting
+    are much cheaper than a 200-tree Random Forest.
+    n_jobs caps the OpenMP threads used for the fit (-1 = all cores).
+    Prints nothing, since it runs in worker processes; main() reports the results.
     """
     split_idx = int(len(X) * (1 - test_size))
     
     X_train, X_test = X.iloc[:split_idx], X.iloc[split_idx:]
     y_train, y_test = y.iloc[:split_idx], y.iloc[split_idx:]
     
-    print(f"\n   Training {model_name}...")
-    print(f"   Train: {len(X_train)} | Test: {len(X_test)}")
-    
-    model = RandomForestClassifier(
-        n_estimators=200,
-        max_depth=10,
-        min_samples_split=5,
-        min_samples_leaf=2,
-        random_state=42,
-        n_jobs=-1
+    model = HistGradientBoostingClassifier(
+        max_iter=300,
+        max_depth=8,
+        learning_rate=0.05,
+        early_stopping=True,
+        validation_fraction=0.15,
+        random_state=42
     )
     
-    model.fit(X_train, y_train)
+    with threadpool_limits(limits=n_jobs if n_jobs > 0 else None):
+        model.fit(X_train, y_train)
     
     y_pred = model.predict(X_test)
     accuracy = accuracy_score(y_test, y_pred)
     
-    print(f"   ✅ Accuracy: {accuracy * 100:.1f}%")
-    
     return model, accuracy
 
 
@@ -176,10 +340,13 @@ def save_models(models: dict, feature_cols: list, accuracies: dict):
     
     for name, model in models.items():
         path = f"model_{name}.pkl"
-        with open(path, 'wb') as f:
-            pickle.dump(model, f)
+        # Uncompressed so glitch_engine can memory-map the tree arrays;
+        # the rest of the model is written with the newest pickle protocol
+        joblib.dump(model, path, protocol=pickle.HIGHEST_PROTOCOL)
         print(f"   Saved: {path}")
     
+    export_onnx_models(models, len(feature_cols))
+    
     # Save config
     config = {
         'features': feature_cols,
@@ -210,6 +377,38 @@ def save_models(models: dict, feature_cols: list, accuracies: dict):
     print("   Saved: features.json")
 
 
+def export_onnx_models(models: dict, n_features: int):
+    """
+    Export each model to ONNX (model_<name>.onnx) for faster inference.
+    glitch_engine uses these when onnxruntime is installed. Skipped if
+    skl2onnx isn't available.
+    """
+    try:
+        from skl2onnx import convert_sklearn
+        from skl2onnx.common.data_types import FloatTensorType
+    except ImportError:
+        print("   ⚠️ skl2onnx not installed, skipping ONNX export")
+        return
+    
+    for name, model in models.items():
+        path = f"model_{name}.onnx"
+        try:
+            onnx_model = convert_sklearn(
+                model,
+                initial_types=[('X', FloatTensorType([None, n_features]))],
+                options={id(model): {'zipmap': False}}
+            )
+        except Exception as e:
+            # Remove any old export so the engine doesn't serve a stale model
+            if os.path.exists(path):
+                os.remove(path)
+            print(f"   ⚠️ Could not export {name} to ONNX ({type(e).__name__}), using .pkl only")
+            continue
+        with open(path, 'wb') as f:
+            f.write(onnx_model.SerializeToString())
+        print(f"   Saved: {path}")
+
+
 def main():
     """
     Main training pipeline for all 3 models.
@@ -221,7 +420,7 @@ def main():
     # Load data
     print("\n📂 Loading master_data.csv...")
     try:
-        df = pd.read_csv('master_data.csv')
+        df = load_training_data('master_data.csv')
         print(f"   Loaded {len(df)} matches")
     except FileNotFoundError:
         print("❌ Error: master_data.csv not found!")
@@ -251,20 +450,31 @@ def main():
     models = {}
     accuracies = {}
     
-    # Model 1: Match Result
-    print("\n📊 Model 1: Match Result (Win/Draw/Loss)")
-    X, y, _ = prepare_data(df, feature_cols, 'Target_Win')
-    models['win'], accuracies['win'] = train_single_model(X, y, "Match Result")
-    
-    # Model 2: Over/Under 2.5 Goals
-    print("\n📊 Model 2: Over/Under 2.5 Goals")
-    X, y, _ = prepare_data(df, feature_cols, 'Target_Goals')
-    models['goals'], accuracies['goals'] = train_single_model(X, y, "Goals O/U 2.5")
-    
-    # Model 3: BTTS
-    print("\n📊 Model 3: Both Teams to Score")
-    X, y, _ = prepare_data(df, feature_cols, 'Target_BTTS')
-    models['btts'], accuracies['btts'] = train_single_model(X, y, "BTTS")
+    # The 3 models are independent, so train them side by side in separate
+    # processes and split the cores between them (random_state keeps results the same)
+    markets = [
+        ('win', 'Target_Win', "Match Result"),
+        ('goals', 'Target_Goals', "Goals O/U 2.5"),
+        ('btts', 'Target_BTTS', "BTTS")
+    ]
+    jobs_per_model = max(1, (os.cpu_count() or 1) // len(markets))
+    print(f"\n📊 Training {len(markets)} models in parallel ({jobs_per_model} cores each)")
+    
+    # One feature matrix shared by all markets; only a target with unknown values needs a row subset
+    X_all, Y_all = prepare_data_all(df, feature_cols, [target_col for _, target_col, _ in markets])
+    
+    with ProcessPoolExecutor(max_workers=len(markets)) as pool:
+        futures = {}
+        for name, target_col, model_name in markets:
+            y = Y_all[target_col]
+            known = (y >= 0).to_numpy()
+            X = X_all if known.all() else X_all[known]
+            print(f"   Training {model_name} on {len(X)} matches (last 20% held out for testing)")
+            futures[name] = pool.submit(train_single_model, X, y[known], n_jobs=jobs_per_model)
+    
+        for name, target_col, model_name in markets:
+            models[name], accuracies[name] = futures[name].result()
+            print(f"   ✅ {model_name} accuracy: {accuracies[name] * 100:.1f}%")
     
     # Save all models
     save_models(models, feature_cols, accuracies)
@@ -4,68 +4,193 @@ Utils - Output Formatting for Telegram
 Creates beautiful, stylized output for multi-market predictions.
 """
 
+import functools
+from io import StringIO
 from typing import Dict, Any, List
 
+# Separator lines, built once
+_SEP_EQ_25 = "═" * 25
+_SEP_EQ_30 = "═" * 30
+_SEP_DASH_25 = "─" * 25
+_SEP_DASH_30 = "─" * 30
+
+# Prediction message blocks, one template each (compact: format_prediction, full: format_single_prediction)
+_HEADER_COMPACT_TPL = "⚽ *{match}*\n\n"
+_SAFEST_COMPACT_TPL = (
+    "🎯 *THE SAFEST GLITCH*\n"
+    "   Bet: *{bet}*\n"
+    "   Confidence: {confidence:.0f}%\n"
+    "   Implied Odds: {odds}\n\n"
+)
+_WIN_COMPACT_TPL = (
+    _SEP_DASH_25 + "\n"
+    "🏆 *Match Result*\n"
+    "   Home: {home:.0f}% | Draw: {draw:.0f}% | Away: {away:.0f}%\n\n"
+)
+_GOALS_COMPACT_TPL = "⚽ *Goals O/U 2.5*\n   Over: {over:.0f}% | Under: {under:.0f}%\n\n"
+_BTTS_COMPACT_TPL = "🥅 *BTTS*\n   Yes: {yes:.0f}% | No: {no:.0f}%\n\n"
+_FORM_COMPACT_TPL = _SEP_DASH_25 + "\n📊 Form: Home {home_form} pts | Away {away_form} pts"
+
+_HEADER_FULL_TPL = (
+    _SEP_EQ_30 + "\n"
+    "🔮 *THE GLITCH - PREDICTION*\n" +
+    _SEP_EQ_30 + "\n\n"
+    "⚽ *{home} vs {away}*\n\n"
+)
+_SAFEST_FULL_TPL = (
+    _SEP_DASH_30 + "\n"
+    "🎯 *THE SAFEST GLITCH*\n\n"
+    "   {emoji} *{bet}*\n"
+    "   📊 Confidence: *{confidence:.0f}%*\n"
+    "   📉 Implied Odds: {odds}\n\n"
+)
+_WIN_FULL_TPL = (
+    _SEP_DASH_30 + "\n"
+    "🏆 *Match Result*\n"
+    "   🏠 Home: {home:.0f}%\n"
+    "   🤝 Draw: {draw:.0f}%\n"
+    "   ✈️ Away: {away:.0f}%\n\n"
+)
+_GOALS_FULL_TPL = (
+    _SEP_DASH_30 + "\n"
+    "⚽ *Over/Under 2.5 Goals*\n"
+    "   📈 Over 2.5: {over:.0f}%\n"
+    "   📉 Under 2.5: {under:.0f}%\n\n"
+)
+_BTTS_FULL_TPL = (
+    _SEP_DASH_30 + "\n"
+    "🥅 *Both Teams to Score*\n"
+    "   ✅ BTTS Yes: {yes:.0f}%\n"
+    "   ❌ BTTS No: {no:.0f}%\n\n"
+)
+_STATS_FULL_TPL = (
+    _SEP_DASH_30 + "\n"
+    "📋 *Stats (Last 5 Games)*\n\n"
+    "   *{home}* (Home):\n"
+    "   Form: {home_stats[form]} pts | Goals: {home_stats[avg_goals]:.1f}\n\n"
+    "   *{away}* (Away):\n"
+    "   Form: {away_stats[form]} pts | Goals: {away_stats[avg_goals]:.1f}\n\n"
+)
+_FOOTER_ML = _SEP_EQ_30 + "\n_🤖 ML Model | For entertainment only_"
+_FOOTER_HEURISTIC = _SEP_EQ_30 + "\n_📊 Heuristic | For entertainment only_"
+
+# Market emoji for each bet the engines produce (glitch_engine and predict_glitch names)
+_BET_EMOJI = {
+    "Home Win": "🏆", "Draw": "🏆", "Away Win": "🏆",
+    "Over 2.5": "⚽", "Under 2.5": "⚽",
+    "BTTS Yes": "🥅", "BTTS No": "🥅", "BTTS": "🥅", "No BTTS": "🥅",
+}
+
+
+def _bet_emoji_fallback(bet: str) -> str:
+    """Emoji for a bet name not in _BET_EMOJI, guessed from its text."""
+    return "🏆" if "Win" in bet else ("⚽" if "2.5" in bet else "🥅")
+
+
+# Implied odds text (100 / confidence) for every whole-number confidence %
+_IMPLIED_ODDS_STR = tuple(f"{100 / c:.2f}" if c > 0 else "0.00" for c in range(101))
+
+
+def _implied_odds_str(confidence) -> str:
+    """Implied odds for a confidence %, as shown in messages ("0.00" if not positive)."""
+    if 0 <= confidence <= 100 and confidence == int(confidence):
+        return _IMPLIED_ODDS_STR[int(confidence)]
+    return f"{100 / confidence:.2f}" if confidence > 0 else "0.00"
+
+
+class _ZeroDefault(dict):
+    """format_map mapping where missing numbers show as 0 (like .get(key, 0))."""
+    
+    def __missing__(self, key):
+        return 0
+
+
+# Market sections shared by both prediction formats: (market, values shown, compact template, full template)
+_MARKET_BLOCKS = (
+    ('win', ('home', 'draw', 'away'), _WIN_COMPACT_TPL, _WIN_FULL_TPL),
+    ('goals', ('over', 'under'), _GOALS_COMPACT_TPL, _GOALS_FULL_TPL),
+    ('btts', ('yes', 'no'), _BTTS_COMPACT_TPL, _BTTS_FULL_TPL),
+)
+
+
+def _render_safest_block(bet, confidence, compact: bool) -> str:
+    """The SAFEST GLITCH block (compact: format_prediction style, else format_single_prediction)."""
+    odds = _implied_odds_str(confidence)
+    if compact:
+        return _SAFEST_COMPACT_TPL.format(bet=bet, confidence=confidence, odds=odds)
+    emoji = _BET_EMOJI.get(bet) or _bet_emoji_fallback(bet)
+    return _SAFEST_FULL_TPL.format(emoji=emoji, bet=bet, confidence=confidence, odds=odds)
+
+
+def _render_market_block(block: tuple, values: Dict[str, Any], compact: bool) -> str:
+    """One _MARKET_BLOCKS section filled from a market's percentages (missing ones show 0)."""
+    _, _, compact_tpl, full_tpl = block
+    return (compact_tpl if compact else full_tpl).format_map(_ZeroDefault(values))
+
 
 def format_prediction(prediction: Dict[str, Any]) -> str:
     """
     Format a single match prediction with multi-market output.
+    Renders are cached per prediction content.
+    """
+    key = _prediction_key(prediction)
+    try:
+        hash(key)
+    except TypeError:
+        # Some value can't be hashed (e.g. a list), so render without the cache
+        return _render_prediction(key)
+    return _render_prediction_cached(key)
+
+
+def _prediction_key(prediction: Dict[str, Any]) -> tuple:
+    """
+    The values format_prediction shows, as a tuple (None for a missing section).
+    Values printed as-is are stored as str, so e.g. form 9 and 9.0 don't share a render.
     """
-    match_name = prediction.get('match', 'Unknown Match')
     preds = prediction.get('predictions', {})
     safest = prediction.get('safest_glitch', {})
-    home_stats = prediction.get('home_stats', {})
-    away_stats = prediction.get('away_stats', {})
     
-    lines = [
-        f"⚽ *{match_name}*",
-        ""
-    ]
+    return (
+        str(prediction.get('match', 'Unknown Match')),
+        (str(safest['bet']), safest['confidence']) if safest else None,
+        tuple(
+            tuple(preds[market].get(name, 0) for name in names) if market in preds else None
+            for market, names, _, _ in _MARKET_BLOCKS
+        ),
+        str(prediction.get('home_stats', {}).get('form', 0)),
+        str(prediction.get('away_stats', {}).get('form', 0))
+    )
+
+
+def _render_prediction(key: tuple) -> str:
+    """Build the format_prediction text from a _prediction_key tuple."""
+    match_name, safest, markets, home_form, away_form = key
+    
+    blocks = [_HEADER_COMPACT_TPL.format(match=match_name)]
     
     # Safest Glitch
     if safest:
-        implied_odds = 100 / safest['confidence'] if safest['confidence'] > 0 else 0
-        lines.extend([
-            "🎯 *THE SAFEST GLITCH*",
-            f"   Bet: *{safest['bet']}*",
-            f"   Confidence: {safest['confidence']:.0f}%",
-            f"   Implied Odds: {implied_odds:.2f}",
-            ""
-        ])
+        blocks.append(_render_safest_block(*safest, compact=True))
     
     # Market summaries
-    if 'win' in preds:
-        win = preds['win']
-        lines.extend([
-            "─────────────────────────",
-            "🏆 *Match Result*",
-            f"   Home: {win.get('home', 0):.0f}% | Draw: {win.get('draw', 0):.0f}% | Away: {win.get('away', 0):.0f}%",
-            ""
-        ])
-    
-    if 'goals' in preds:
-        goals = preds['goals']
-        lines.extend([
-            "⚽ *Goals O/U 2.5*",
-            f"   Over: {goals.get('over', 0):.0f}% | Under: {goals.get('under', 0):.0f}%",
-            ""
-        ])
-    
-    if 'btts' in preds:
-        btts = preds['btts']
-        lines.extend([
-            "🥅 *BTTS*",
-            f"   Yes: {btts.get('yes', 0):.0f}% | No: {btts.get('no', 0):.0f}%",
-            ""
-        ])
+    for block, values in zip(_MARKET_BLOCKS, markets):
+        if values is not None:
+            blocks.append(_render_market_block(block, dict(zip(block[1], values)), compact=True))
     
     # Stats used
-    lines.extend([
-        "─────────────────────────",
-        f"📊 Form: Home {home_stats.get('form', 0)} pts | Away {away_stats.get('form', 0)} pts",
-    ])
+    blocks.append(_FORM_COMPACT_TPL.format(home_form=home_form, away_form=away_form))
     
-    return "\n".join(lines)
+    return "".join(blocks)
+
+
+# Refreshes re-send the same predictions, so identical ones reuse their text
+_render_prediction_cached = functools.lru_cache(maxsize=256)(_render_prediction)
+
+
+# Multi-match message parts: a separator after every match, header and footer around them
+_MATCH_SEPARATOR = f"\n\n{_SEP_EQ_25}\n\n"
+_ALL_HEADER = f"🧠 *PROJECT GLITCH - PREDICTIONS*\n{_SEP_EQ_25}\n\n"
+_ALL_FOOTER = "⚠️ _Disclaimer: For entertainment only._\n🤖 Powered by The Glitch Engine v2.0"
 
 
 def format_all_predictions(predictions: List[Dict[str, Any]]) -> str:
@@ -75,31 +200,12 @@ def format_all_predictions(predictions: List[Dict[str, Any]]) -> str:
     if not predictions:
         return "❌ No predictions available."
     
-    sections = [
-        "🧠 *PROJECT GLITCH - PREDICTIONS*",
-        "═" * 25,
-        ""
-    ]
-    
-    for pred in predictions:
-        sections.append(format_prediction(pred))
-        sections.append("")
-        sections.append("═" * 25)
-        sections.append("")
-    
-    sections.extend([
-        "⚠️ _Disclaimer: For entertainment only._",
-        "🤖 Powered by The Glitch Engine v2.0"
-    ])
-    
-    return "\n".join(sections)
+    body = _MATCH_SEPARATOR.join(format_prediction(pred) for pred in predictions)
+    return f"{_ALL_HEADER}{body}{_MATCH_SEPARATOR}{_ALL_FOOTER}"
 
 
-def format_welcome_message() -> str:
-    """
-    Format the welcome message for /start command.
-    """
-    return """
+# Fixed messages: the formatters below just return these
+WELCOME_MESSAGE = """
 🔮 *INITIALIZING PROJECT GLITCH...*
 
 ```
@@ -121,11 +227,14 @@ Welcome to *The Glitch* - Your EPL Prediction Engine.
 """
 
 
-def format_loading_message() -> str:
+def format_welcome_message() -> str:
     """
-    Format a loading message.
+    Format the welcome message for /start command.
     """
-    return """
+    return WELCOME_MESSAGE
+
+
+LOADING_MESSAGE = """
 🔄 *ANALYZING DATA...*
 
 ```
@@ -137,29 +246,34 @@ Please wait...
 """
 
 
-def format_error_message(error: str = None) -> str:
+def format_loading_message() -> str:
     """
-    Format an error message.
+    Format a loading message.
     """
-    msg = """
+    return LOADING_MESSAGE
+
+
+_ERROR_HEAD = """
 ❌ *SYSTEM ERROR*
 
 ```
 [ERROR] Prediction failed
 ```
 """
-    if error:
-        msg += f"\n_Details:_ {error}"
-    
-    msg += "\n\n🔧 Try again in a few moments."
-    return msg
+_ERROR_TAIL = "\n\n🔧 Try again in a few moments."
+_ERROR_MESSAGE = _ERROR_HEAD + _ERROR_TAIL
 
 
-def format_no_matches_message() -> str:
+def format_error_message(error: str = None) -> str:
     """
-    Format message when no matches are scheduled.
+    Format an error message.
     """
-    return """
+    if error:
+        return f"{_ERROR_HEAD}\n_Details:_ {error}{_ERROR_TAIL}"
+    return _ERROR_MESSAGE
+
+
+NO_MATCHES_MESSAGE = """
 📅 *NO MATCHES TODAY*
 
 ```
@@ -173,27 +287,30 @@ Use `/predict TeamA vs TeamB` for custom predictions!
 """
 
 
+def format_no_matches_message() -> str:
+    """
+    Format message when no matches are scheduled.
+    """
+    return NO_MATCHES_MESSAGE
+
+
+# Teams list parts, with the " 1. " ... "50. " row numbers made up front
+_TEAMS_HEAD = f"📋 *AVAILABLE TEAMS*\n{_SEP_EQ_25}\n\n"
+_TEAMS_TAIL = f"\n{_SEP_DASH_25}\nUse: `/predict Arsenal vs Chelsea`"
+_ROW_PREFIXES = tuple(f"{i:2}. " for i in range(1, 51))
+
+
 def format_teams_list(teams: List[str]) -> str:
     """
     Format the list of available teams.
     """
-    lines = [
-        "📋 *AVAILABLE TEAMS*",
-        "═" * 25,
-        ""
-    ]
+    if len(teams) <= len(_ROW_PREFIXES):
+        prefixes = _ROW_PREFIXES
+    else:
+        prefixes = [f"{i:2}. " for i in range(1, len(teams) + 1)]
     
-    # Split into columns
-    for i, team in enumerate(teams, 1):
-        lines.append(f"{i:2}. {team}")
-    
-    lines.extend([
-        "",
-        "─────────────────────────",
-        "Use: `/predict Arsenal vs Chelsea`"
-    ])
-    
-    return "\n".join(lines)
+    rows = "".join(f"{prefix}{team}\n" for prefix, team in zip(prefixes, teams))
+    return f"{_TEAMS_HEAD}{rows}{_TEAMS_TAIL}"
 
 
 def format_single_prediction(result: Dict[str, Any]) -> str:
@@ -208,82 +325,31 @@ def format_single_prediction(result: Dict[str, Any]) -> str:
     away_stats = result.get('away_stats', {})
     using_ml = result.get('using_ml', False)
     
-    lines = [
-        "═" * 30,
-        "🔮 *THE GLITCH - PREDICTION*",
-        "═" * 30,
-        "",
-        f"⚽ *{home} vs {away}*",
-        "",
-    ]
+    buf = StringIO()
+    write = buf.write
+    write(_HEADER_FULL_TPL.format(home=home, away=away))
     
     # Safest Glitch
     if safest:
-        implied_odds = 100 / safest['confidence'] if safest['confidence'] > 0 else 0
-        emoji = "🏆" if "Win" in safest['bet'] else ("⚽" if "2.5" in safest['bet'] else "🥅")
-        lines.extend([
-            "─" * 30,
-            "🎯 *THE SAFEST GLITCH*",
-            "",
-            f"   {emoji} *{safest['bet']}*",
-            f"   📊 Confidence: *{safest['confidence']:.0f}%*",
-            f"   📉 Implied Odds: {implied_odds:.2f}",
-            ""
-        ])
+        write(_render_safest_block(safest['bet'], safest['confidence'], compact=False))
     
     # All markets
-    if 'win' in preds:
-        win = preds['win']
-        lines.extend([
-            "─" * 30,
-            "🏆 *Match Result*",
-            f"   🏠 Home: {win.get('home', 0):.0f}%",
-            f"   🤝 Draw: {win.get('draw', 0):.0f}%",
-            f"   ✈️ Away: {win.get('away', 0):.0f}%",
-            ""
-        ])
-    
-    if 'goals' in preds:
-        goals = preds['goals']
-        lines.extend([
-            "─" * 30,
-            "⚽ *Over/Under 2.5 Goals*",
-            f"   📈 Over 2.5: {goals.get('over', 0):.0f}%",
-            f"   📉 Under 2.5: {goals.get('under', 0):.0f}%",
-            ""
-        ])
-    
-    if 'btts' in preds:
-        btts = preds['btts']
-        lines.extend([
-            "─" * 30,
-            "🥅 *Both Teams to Score*",
-            f"   ✅ BTTS Yes: {btts.get('yes', 0):.0f}%",
-            f"   ❌ BTTS No: {btts.get('no', 0):.0f}%",
-            ""
-        ])
+    for block in _MARKET_BLOCKS:
+        if block[0] in preds:
+            write(_render_market_block(block, preds[block[0]], compact=False))
     
     # Stats
-    lines.extend([
-        "─" * 30,
-        "📋 *Stats (Last 5 Games)*",
-        "",
-        f"   *{home}* (Home):",
-        f"   Form: {home_stats.get('form', 0)} pts | Goals: {home_stats.get('avg_goals', 0):.1f}",
-        "",
-        f"   *{away}* (Away):",
-        f"   Form: {away_stats.get('form', 0)} pts | Goals: {away_stats.get('avg_goals', 0):.1f}",
-        ""
-    ])
+    write(_STATS_FULL_TPL.format_map({
+        'home': home,
+        'away': away,
+        'home_stats': _ZeroDefault(home_stats),
+        'away_stats': _ZeroDefault(away_stats)
+    }))
     
     # Footer
-    ml_indicator = "🤖 ML Model" if using_ml else "📊 Heuristic"
-    lines.extend([
-        "═" * 30,
-        f"_{ml_indicator} | For entertainment only_"
-    ])
+    write(_FOOTER_ML if using_ml else _FOOTER_HEURISTIC)
     
-    return "\n".join(lines)
+    return buf.getvalue()
 
 
 if __name__ == "__main__":